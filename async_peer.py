@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import threading
+import protocol
+import queue
+import socket
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from peer import Peer, MAX_CONNECTIONS
+from scheduler import ChunkScheduler, HEDGE_CHECK_INTERVAL
+from connection import POOL_IDLE_TIMEOUT, CONNECT_TIMEOUT, RESPONSE_TIMEOUT, SERVER_IDLE_TIMEOUT, SERVER_IO_TIMEOUT
+
+
+STREAM_LIMIT = 16 * 1024 * 1024  # Tamanho máximo de uma linha lida pelos StreamReaders
+ASYNC_CONNECTIONS_PER_PEER = 64  # Conexões simultâneas (e ociosas mantidas) por vizinho
+ASYNC_MAX_IN_FLIGHT = 1024       # Requisições de chunk em andamento por download
+# Limite da janela adaptativa de cada peer. Cada requisição em andamento ocupa uma conexão, então é também o número
+# de conexões que um download abre para um peer; a janela só chega a esse valor enquanto ele responde em dia.
+ASYNC_MAX_WINDOW = ASYNC_CONNECTIONS_PER_PEER
+
+logger = logging.getLogger(__name__)
+
+
+# Adapta um StreamWriter à interface de socket usada por Peer.handle_command. Com loop, o tratador roda fora do
+# event loop: cada envio é entregue ao loop e espera o buffer de escrita esvaziar (drain), então uma resposta
+# grande (ex.: um DL_RANGE inteiro) não se acumula na memória à frente de um cliente lento.
+class StreamConnection:
+    def __init__(self, writer, loop=None):
+        self.writer = writer
+        self.loop = loop
+
+    def sendall(self, data, flags=0):
+        if self.loop is None:
+            self.writer.write(data)
+            return
+        future = asyncio.run_coroutine_threadsafe(self.write(data), self.loop)
+        try:
+            future.result(SERVER_IO_TIMEOUT)
+        except FutureTimeout:
+            future.cancel()
+            raise socket.timeout("tempo esgotado enviando a resposta") from None
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+# Peer que usa um event loop asyncio para o servidor e para os downloads, no lugar de threads.
+# Fala o mesmo protocolo de Peer e reaproveita seu tratamento de mensagens.
+class AsyncPeer(Peer):
+    def start_server(self):
+        self.loop = asyncio.new_event_loop()
+        self.idle_streams = {}
+        self.peer_limits = {}
+        self.pending_commands = queue.Queue()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+        # Os pedidos recebidos são tratados por workers daemon, como os do servidor de Peer: as leituras de disco
+        # não travam o event loop, e um envio esperando um cliente lento não segura o encerramento do programa
+        def worker_thread():
+            while True:
+                future, args = self.pending_commands.get()
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(self.handle_command(*args))
+                    except BaseException as e:
+                        future.set_exception(e)
+
+        for _ in range(self.server_workers):
+            threading.Thread(target=worker_thread, daemon=True).start()
+
+        try:
+            self.run(self.start_async_server())
+        except Exception as e:
+            logger.error("[Erro] %s:%s não está disponível: %s", self.ip, self.port, e)
+
+    def run(self, coroutine):
+        """Executa uma corrotina no event loop do peer e espera o resultado"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def start_async_server(self):
+        self.server = await asyncio.start_server(
+            self.handle_stream, self.ip, int(self.port), backlog=MAX_CONNECTIONS, limit=STREAM_LIMIT)
+
+    # Atende todas as mensagens de uma conexão até o cliente fechá-la ou ela ficar ociosa
+    async def handle_stream(self, reader, writer):
+        with self.server_lock:
+            self.server_stats["accepted"] += 1
+            self.server_stats["active"] += 1
+        conn = StreamConnection(writer, self.loop)
+        try:
+            while True:
+                try:
+                    line, payload = await asyncio.wait_for(self.async_read_message(reader), SERVER_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                data = line.decode()
+                if data.strip():
+                    await self.run_command(data, conn, payload)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logger.error("[Erro] Falha ao processar mensagem: %s", e)
+        finally:
+            with self.server_lock:
+                self.server_stats["active"] -= 1
+            writer.close()
+
+    async def run_command(self, command, conn, payload):
+        """Trata a mensagem num worker, esperando sem bloquear o event loop"""
+        future = Future()
+        self.pending_commands.put((future, (command, conn, payload)))
+        return await asyncio.wrap_future(future)
+
+    # Equivalente assíncrono de Peer.read_message
+    @staticmethod
+    async def async_read_message(reader):
+        line = await reader.readline()
+        if not line:
+            return None, None
+        header = protocol.parse_chunk_header(line)
+        if header is not None:
+            return line, (header, await reader.readexactly(header[6]))
+        return line, None
+
+    def peer_limit(self, key):
+        if key not in self.peer_limits:
+            self.peer_limits[key] = asyncio.Semaphore(ASYNC_CONNECTIONS_PER_PEER)
+        return self.peer_limits[key]
+
+    async def open_stream(self, key, timeout=None):
+        """Retorna uma conexão ociosa para o vizinho ou abre uma nova, esperando no máximo timeout para conectar"""
+        streams = self.idle_streams.get(key)
+        now = time.monotonic()
+        while streams:
+            reader, writer, last_used = streams.pop()
+            if now - last_used <= POOL_IDLE_TIMEOUT and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(key[0], key[1], limit=STREAM_LIMIT),
+            min(timeout, CONNECT_TIMEOUT) if timeout else CONNECT_TIMEOUT)
+        return reader, writer, False
+
+    def release_stream(self, key, reader, writer):
+        streams = self.idle_streams.setdefault(key, [])
+        if len(streams) < ASYNC_CONNECTIONS_PER_PEER:
+            streams.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    # Equivalente assíncrono de Peer.send_command
+    async def async_send_command(self, command, ip, port, expect_response=False, timeout=None, quiet=False) -> bool:
+        splitted_command = command.split()
+        if len(splitted_command) < 3:
+            logger.error("Incorrect message format")
+            return False
+
+        key = (ip, int(port))
+        async with self.peer_limit(key):
+            # Uma conexão reaproveitada pode ter sido fechada pelo outro lado; nesse caso tenta de novo com uma nova
+            for attempt in range(2):
+                writer = None
+                reused = False
+                try:
+                    reader, writer, reused = await self.open_stream(key, timeout)
+                    writer.write(command.encode())
+                    await writer.drain()
+                    if expect_response:
+                        response, payload = await asyncio.wait_for(self.async_read_message(reader), timeout or RESPONSE_TIMEOUT)
+                        if not response:
+                            raise ConnectionError("conexão encerrada sem resposta")
+                        self.handle_command(response.decode(), StreamConnection(writer), payload)
+                    self.release_stream(key, reader, writer)
+                    return True
+                except Exception as e:
+                    if writer is not None:
+                        writer.close()
+                        if reused and attempt == 0 and not isinstance(e, asyncio.TimeoutError):
+                            continue
+                    if not quiet:
+                        logger.error("[Erro] Não foi possível conectar com %s:%s - %s", ip, port, e)
+                    return False
+
+    def send_command(self, command, ip, port, expect_response=False, timeout=None, quiet=False) -> bool:
+        return self.run(self.async_send_command(command, ip, port, expect_response, timeout, quiet))
+
+    # Equivalente assíncrono de download_chunk (main.py)
+    async def async_download_chunk(self, file_name, chunk_size, chunk_index, peer_ip, peer_port, timeout=None):
+        clock = self.increment_clock()
+        message = protocol.format_message(self.ip, self.port, clock, "DL", file_name, chunk_size, chunk_index,
+                                          *self.transfer_options())
+        success = await self.async_send_command(message, peer_ip, peer_port, expect_response=True, timeout=timeout)
+        return success and self.has_chunk(file_name, chunk_index)
+
+    async def async_download_file(self, file_name, file_size, chunk_size, peer_list, availability=None,
+                                  refresh_interval=None):
+        total_chunks = (file_size + chunk_size - 1) // chunk_size
+        scheduler = ChunkScheduler(total_chunks, peer_list, chunk_size, max_window=ASYNC_MAX_WINDOW,
+                                   response_timeout=RESPONSE_TIMEOUT, chunks=self.missing_chunks(file_name),
+                                   availability=availability)
+        condition = asyncio.Condition()
+
+        # As conclusões acontecem no próprio event loop, então não há corrida entre consultar o escalonador e esperar
+        async def worker(peer):
+            while True:
+                chunk_index = scheduler.try_next_chunk(peer)
+                if chunk_index is None:
+                    if scheduler.finished():
+                        async with condition:
+                            condition.notify_all()
+                        return
+                    # Acorda periodicamente para pedir em duplicata chunks atrasados (hedging)
+                    async with condition:
+                        try:
+                            await asyncio.wait_for(condition.wait(), HEDGE_CHECK_INTERVAL)
+                        except asyncio.TimeoutError:
+                            pass
+                    continue
+                started = time.monotonic()
+                try:
+                    success = await self.async_download_chunk(
+                        file_name, chunk_size, chunk_index, peer[0], peer[1], scheduler.request_timeout())
+                except Exception as e:
+                    logger.error("Erro no chunk %s: %s", chunk_index, e)
+                    success = False
+                if success:
+                    size = min(chunk_size, file_size - chunk_index * chunk_size)
+                    scheduler.complete(peer, chunk_index, size, time.monotonic() - started)
+                else:
+                    logger.warning("Falha ao baixar chunk %s de %s:%s", chunk_index, peer[0], peer[1])
+                    scheduler.fail(peer, chunk_index)
+                # Este worker continua pedindo; basta acordar mais um para a vaga aberta se a janela cresceu ou um
+                # chunk voltou à fila. Os demais acordam no HEDGE_CHECK_INTERVAL.
+                async with condition:
+                    condition.notify()
+
+        # Os peers com o arquivo incompleto continuam baixando: os chunks novos passam a poder ser pedidos a eles.
+        # chunk_availability espera as respostas (pelo event loop), então roda fora dele.
+        async def refresh_availability():
+            loop = asyncio.get_running_loop()
+            while True:
+                await asyncio.sleep(refresh_interval)
+                found = await loop.run_in_executor(None, self.chunk_availability, file_name, file_size, chunk_size,
+                                                   list(availability))
+                for peer, chunks in found.items():
+                    scheduler.add_available(peer, chunks)
+                async with condition:
+                    condition.notify_all()
+
+        start_time = time.time()
+        refresh = None
+        if availability and refresh_interval:
+            refresh = asyncio.ensure_future(refresh_availability())
+        workers_per_peer = min(ASYNC_MAX_WINDOW, max(1, ASYNC_MAX_IN_FLIGHT // max(1, len(peer_list))))
+        try:
+            await asyncio.gather(*(worker(peer) for peer in peer_list for _ in range(workers_per_peer)))
+        finally:
+            if refresh is not None:
+                refresh.cancel()
+        self.report_scheduler(scheduler)
+        return time.time() - start_time
+
+    def download_file(self, file_name, file_size, chunk_size, peer_list, availability=None, refresh_interval=None):
+        """Faz o download de todos os chunks no event loop e retorna a duração. Com availability (peer -> chunks que
+        ele tem), peers com o arquivo incompleto também servem chunks, consultados de novo a cada refresh_interval."""
+        return self.run(self.async_download_file(file_name, file_size, chunk_size, peer_list, availability,
+                                                 refresh_interval))
@@ -0,0 +1,109 @@
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import protocol
+from chunk_cache import ChunkCache, CHUNK_CACHE_BYTES
+from helpers import free_ports
+
+
+CLIENTS = 16             # Peers baixando o mesmo arquivo ao mesmo tempo (flash crowd)
+FILE_SIZE = 4 * 1024 * 1024  # Tamanho do arquivo popular
+CHUNK_SIZE = 4096        # Tamanho de chunk pedido pelos clientes
+BATCH = 256              # Chunks por pedido DL_RANGE
+STARTUP = 1.0            # Espera até o seeder começar a aceitar conexões [s]
+REPEAT = 3               # Execuções de cada caso; vale a mais rápida
+FILE_NAME = "popular.txt"
+
+
+def serve(port, directory, capacity):
+    """Processo do seeder: um Peer que só atende pedidos, com o cache do tamanho dado (0 o desliga)"""
+    from peer import Peer
+    seeder = Peer("127.0.0.1", port, directory, "ONLINE", [], CHUNK_SIZE)
+    seeder.chunk_cache = ChunkCache(capacity)
+    sys.stdin.read()
+
+
+def download(port, binary, chunks, errors):
+    """Um cliente: pede o arquivo inteiro em lotes DL_RANGE numa conexão e lê as respostas até cada RANGE_END"""
+    decoder = protocol.FrameDecoder()
+    mode = ("BIN",) if binary else ()
+    try:
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            for start in range(0, chunks, BATCH):
+                end = min(chunks, start + BATCH) - 1
+                sock.sendall(protocol.format_message("127.0.0.1", 1, 1, "DL_RANGE", FILE_NAME, CHUNK_SIZE,
+                                                     f"{start}-{end}", *mode).encode())
+                while True:
+                    frame = decoder.next_frame()
+                    if frame is None:
+                        data = sock.recv(max(65536, decoder.missing()))
+                        if not data:
+                            raise ConnectionError("seeder encerrou a conexão")
+                        decoder.feed(data)
+                        continue
+                    if frame[0].split(maxsplit=3)[2] == b"RANGE_END":
+                        break
+    except Exception as e:
+        errors.append(e)
+
+
+def run(directory, capacity, binary):
+    """Retorna (duração, tempo de CPU gasto pelo seeder)"""
+    port, = free_ports(1)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server = subprocess.Popen([sys.executable, __file__, "serve", str(port), directory, str(capacity)],
+                              stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(STARTUP)
+        chunks = -(-FILE_SIZE // CHUNK_SIZE)
+        errors = []
+        clients = [threading.Thread(target=download, args=(port, binary, chunks, errors)) for _ in range(CLIENTS)]
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+    finally:
+        server.stdin.close()
+        server.wait()
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Inclui a inicialização do seeder, igual nos dois casos
+    return elapsed, (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        # Texto compressível, como os arquivos de teste/
+        line = b"0123456789 abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ\n"
+        with open(os.path.join(directory, FILE_NAME), "wb") as file:
+            file.write((line * (FILE_SIZE // len(line) + 1))[:FILE_SIZE])
+
+        total = CLIENTS * FILE_SIZE
+        print(f"{CLIENTS} clientes baixando o mesmo arquivo de {FILE_SIZE // 1024} KB em chunks de {CHUNK_SIZE} bytes\n")
+        print(f"{'Modo':<7} | {'Cache':<9} | {'Tempo (s)':<9} | {'MB/s':<7} | {'CPU do seeder (s)':<17}")
+        print("-" * 62)
+        for binary in (False, True):
+            for name, capacity in (("desligado", 0), ("ligado", CHUNK_CACHE_BYTES)):
+                results = []
+                for _ in range(REPEAT):
+                    results.append(run(directory, capacity, binary))
+                elapsed, cpu = min(results)
+                print(f"{'FILEB' if binary else 'FILE':<7} | {name:<9} | {elapsed:<9.3f} | "
+                      f"{total / elapsed / 1e6:<7.1f} | {cpu:<17.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        serve(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,136 @@
+import contextlib
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lamport import LamportClock
+
+
+THREADS = 32          # Threads atualizando o relógio ao mesmo tempo (workers de download + servidor)
+OPERATIONS = 20000    # Atualizações por thread
+MERGE_RATIO = 0.3     # Fração das atualizações que são recebimentos (merge); o resto são envios (tick)
+SWITCH_INTERVAL = 1e-5  # Troca de threads mais frequente que o padrão, para as corridas aparecerem
+REPEAT = 5            # Execuções de cada relógio; o tempo reportado é a mediana
+
+
+# Comportamento anterior do Peer: leitura-modificação-escrita sem sincronização, com print a cada atualização
+class PrintClock:
+    def __init__(self):
+        self.clock = 0
+
+    def tick(self):
+        self.clock += 1
+        print(f" => Atualizando relogio para {self.clock}")
+        return self.clock
+
+    def merge(self, received):
+        if received > self.clock:
+            self.clock = received
+            print(f"=> Atualizando relogio para {self.clock}")
+        return self.tick()
+
+
+# O mesmo sem o print, para separar o custo da saída do custo da corrida
+class UnsafeClock:
+    def __init__(self):
+        self.clock = 0
+
+    def tick(self):
+        self.clock += 1
+        return self.clock
+
+    def merge(self, received):
+        if received > self.clock:
+            self.clock = received
+        return self.tick()
+
+
+# Alternativa direta: um lock global em todas as operações
+class LockedClock:
+    def __init__(self):
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    def tick(self):
+        with self.lock:
+            self.clock += 1
+            return self.clock
+
+    def merge(self, received):
+        with self.lock:
+            self.clock = max(self.clock, received) + 1
+            return self.clock
+
+
+def run(clock, threads, operations, merge_ratio):
+    """Executa a carga e retorna (duração, valores emitidos, merges que não passaram do clock recebido)"""
+    results = [None] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        rng = random.Random(index)
+        # Clocks recebidos: em geral um pouco atrás do local, às vezes à frente e, raramente, muito à frente
+        # (um peer que ficou muito tempo ativo sem trocar mensagens com este)
+        plan = [(rng.randint(-200, 50) + (100000 if rng.random() < 0.001 else 0)) if rng.random() < merge_ratio
+                else None for _ in range(operations)]
+        values = [0]
+        stale = 0
+        barrier.wait()
+        started = time.perf_counter()
+        for offset in plan:
+            if offset is None:
+                values.append(clock.tick())
+            else:
+                received = values[-1] + offset
+                value = clock.merge(received)
+                if value <= received:
+                    stale += 1
+                values.append(value)
+        del values[0]
+        results[index] = (values, stale, started, time.perf_counter())
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    # Medido pelas próprias threads, do início da primeira ao fim da última
+    duration = max(r[3] for r in results) - min(r[2] for r in results)
+    values = [value for thread_values, *_ in results for value in thread_values]
+    return duration, values, sum(stale for _, stale, *_ in results)
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS
+    operations = int(sys.argv[2]) if len(sys.argv) > 2 else OPERATIONS
+    sys.setswitchinterval(SWITCH_INTERVAL)
+    total = threads * operations
+    print(f"{threads} threads x {operations} atualizações ({MERGE_RATIO:.0%} merges), {REPEAT} execuções\n")
+    print(f"{'Relógio':<22} | {'Tempo (s)':<9} | {'Mops/s':<7} | {'Repetidos':<9} | {'Merges atrasados':<16}")
+    print("-" * 76)
+    implementations = [
+        ("atual (com print)", PrintClock),
+        ("atual (sem print)", UnsafeClock),
+        ("lock global", LockedClock),
+        ("LamportClock", LamportClock),
+    ]
+    for name, factory in implementations:
+        durations = []
+        duplicates = stale = 0
+        for _ in range(REPEAT):
+            # O print do relógio antigo vai para /dev/null: mede o custo da formatação e da escrita, não do terminal
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                duration, values, late = run(factory(), threads, operations, MERGE_RATIO)
+            durations.append(duration)
+            duplicates += total - len(set(values))
+            stale += late
+        duration = statistics.median(durations)
+        print(f"{name:<22} | {duration:<9.3f} | {total / duration / 1e6:<7.2f} | {duplicates:<9} | {stale:<16}")
+
+
+if __name__ == "__main__":
+    main()
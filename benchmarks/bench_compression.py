@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import compression
+
+
+DATA_SIZE = 4 * 1024 * 1024   # Bytes de cada tipo de conteúdo comprimidos chunk a chunk
+CHUNK_SIZES = (4096, 65536)
+LINK_MBITS = 100              # Link entre os sites, usado para estimar o tempo de transferência
+
+
+def log_data(size):
+    """Linhas de log como as que os peers trocam entre os sites"""
+    rng = random.Random(1)
+    levels = ["INFO", "INFO", "INFO", "DEBUG", "WARNING"]
+    lines = []
+    total = 0
+    while total < size:
+        line = (f"2026-10-18 12:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(1000):03d} "
+                f"{rng.choice(levels)} peer 10.0.{rng.randrange(4)}.{rng.randrange(256)}:{5000 + rng.randrange(50)} "
+                f"chunk {rng.randrange(100000)} do arquivo dados_{rng.randrange(20)}.csv em {rng.random():.4f} s\n")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def source_data(size):
+    """Código-fonte deste repositório, repetido até o tamanho pedido"""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    text = b"".join(open(os.path.join(root, name), "rb").read() for name in sorted(os.listdir(root))
+                    if name.endswith(".py"))
+    return (text * (size // len(text) + 1))[:size]
+
+
+def transfer_time(sent, cpu):
+    return sent * 8 / (LINK_MBITS * 1e6) + cpu
+
+
+def measure(codec, data, chunk_size):
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    compress, decompress = compression.CODECS[codec]
+    started = time.perf_counter()
+    compressed = [compress(chunk) for chunk in chunks]
+    compress_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for chunk in compressed:
+        decompress(chunk, chunk_size)
+    decompress_time = time.perf_counter() - started
+    return sum(len(chunk) for chunk in compressed), compress_time, decompress_time
+
+
+def adaptive(data, chunk_size, codec):
+    """Bytes enviados e tempo gasto pela política adaptativa, que para de comprimir o que não compensa"""
+    policy = compression.CompressionPolicy()
+    started = time.perf_counter()
+    sent = sum(len(policy.compress("arquivo", codec, data[i:i + chunk_size])[1])
+               for i in range(0, len(data), chunk_size))
+    return sent, time.perf_counter() - started
+
+
+def main():
+    contents = {
+        "log": log_data(DATA_SIZE),
+        "código-fonte": source_data(DATA_SIZE),
+        "aleatório": os.urandom(DATA_SIZE),
+    }
+    print(f"Compressão chunk a chunk de {DATA_SIZE // 2 ** 20} MB; transferência estimada num link de "
+          f"{LINK_MBITS} Mbit/s (sem compressão: {transfer_time(DATA_SIZE, 0):.2f} s)")
+    print(f"Compressores disponíveis: {', '.join(compression.CODECS)}\n")
+    print(f"{'Conteúdo':<13} | {'Chunk':<6} | {'Compressor':<10} | {'Razão':<6} | {'Compr. MB/s':<11} | "
+          f"{'Descompr. MB/s':<14} | {'Transferência (s)':<17}")
+    print("-" * 94)
+    for name, data in contents.items():
+        for chunk_size in CHUNK_SIZES:
+            for codec in compression.CODECS:
+                sent, compress_time, decompress_time = measure(codec, data, chunk_size)
+                total = transfer_time(sent, compress_time + decompress_time)
+                print(f"{name:<13} | {chunk_size:<6} | {codec:<10} | {sent / len(data):<6.2f} | "
+                      f"{len(data) / compress_time / 1e6:<11.0f} | {len(data) / decompress_time / 1e6:<14.0f} | "
+                      f"{total:<17.2f}")
+
+    codec = next(iter(compression.CODECS))
+    print(f"\nPolítica adaptativa ({codec}, chunks de {CHUNK_SIZES[0]} bytes)")
+    print(f"{'Conteúdo':<13} | {'Razão':<6} | {'Tempo de CPU (ms)':<17} | {'Comprimindo sempre (ms)':<23}")
+    print("-" * 68)
+    for name, data in contents.items():
+        sent, elapsed = adaptive(data, CHUNK_SIZES[0], codec)
+        _, always, _ = measure(codec, data, CHUNK_SIZES[0])
+        print(f"{name:<13} | {sent / len(data):<6.2f} | {elapsed * 1000:<17.1f} | {always * 1000:<23.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from file_cache import FileHandleCache
+
+
+FILE_SIZE = 64 * 1024 * 1024  # Tamanho do arquivo compartilhado
+REQUESTS = 200000             # Pedidos DL atendidos em cada caso
+REPEAT = 3                    # Execuções de cada caso; vale a mais rápida
+
+
+# Caminho de leitura anterior do DL: exists + open + seek + read + close a cada pedido
+def read_reopen(path, offsets, chunk_size):
+    for offset in offsets:
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                file.seek(offset)
+                file.read(chunk_size)
+
+
+def read_cached(cache, path, offsets, chunk_size):
+    for offset in offsets:
+        handle = cache.acquire(path)
+        try:
+            handle.read(offset, chunk_size)
+        finally:
+            cache.release(handle)
+
+
+def best(function, *args):
+    times = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "big.bin")
+        with open(path, "wb") as file:
+            file.write(os.urandom(FILE_SIZE))
+        rng = random.Random(1)
+        print(f"{REQUESTS} pedidos DL de chunks sorteados de um arquivo de {FILE_SIZE // 2 ** 20} MB (no page cache)\n")
+        print(f"{'Chunk':<7} | {'Reabrindo (µs)':<14} | {'Cache + pread (µs)':<18} | {'Cache + mmap (µs)':<17}")
+        print("-" * 66)
+        for chunk_size in (256, 4096, 65536):
+            offsets = [rng.randrange(FILE_SIZE // chunk_size) * chunk_size for _ in range(REQUESTS)]
+            reopen = best(read_reopen, path, offsets, chunk_size)
+            pread = best(read_cached, FileHandleCache(use_mmap=False), path, offsets, chunk_size)
+            mapped = best(read_cached, FileHandleCache(use_mmap=True), path, offsets, chunk_size)
+            print(f"{chunk_size:<7} | {reopen / REQUESTS * 1e6:<14.2f} | {pread / REQUESTS * 1e6:<18.2f} | "
+                  f"{mapped / REQUESTS * 1e6:<17.2f}")
+
+
+if __name__ == "__main__":
+    main()
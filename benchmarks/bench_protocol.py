@@ -0,0 +1,175 @@
+import base64
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import protocol
+
+
+REPEAT = 5            # Medições de cada caso; vale a melhor
+STREAM_MESSAGES = 20000  # Mensagens do fluxo usado no teste do leitor de mensagens
+MAX_READ = 65536      # Maior pedaço entregue por recv no teste do leitor (o tamanho pedido pelo SocketReader)
+
+SENDER = "127.0.0.1:5000"
+MESSAGES = {
+    "HELLO": f"{SENDER} 12 HELLO\n",
+    "DL": f"{SENDER} 12 DL 100KB.txt 4096 17 BIN\n",
+    "FILEB (cabeçalho)": f"{SENDER} 12 FILEB 100KB.txt 4096 17 4096\n",
+    "FILE 256 B": f"{SENDER} 12 FILE 100KB.txt 256 17 {base64.b64encode(os.urandom(256)).decode()}\n",
+    "FILE 64 KB": f"{SENDER} 12 FILE 100KB.txt 65536 17 {base64.b64encode(os.urandom(65536)).decode()}\n",
+}
+
+
+# Interpretação anterior: o leitor dividia o cabeçalho para achar o FILEB, handle_command dividia a linha e o
+# endereço duas vezes, e o FILE dividia a linha de novo para extrair o base64
+def legacy_parse(command):
+    command.encode().split(maxsplit=7)
+    splitted_command = command.split()
+    sender_clock = int(splitted_command[1])
+    sender_ip = splitted_command[0].split(":")[0]
+    sender_port = splitted_command[0].split(":")[1]
+    if splitted_command[2] == "FILE":
+        command.split(" ", 6)[-1].strip()
+    return sender_ip, sender_port, sender_clock, splitted_command
+
+
+# Caminho atual: o leitor acha o FILEB pelo cabeçalho, que vai para parse_chunk_header; o resto vira uma Message
+def parse(command):
+    return protocol.parse_chunk_header(command.encode()) or protocol.parse(command)
+
+
+# Leitor anterior (connection.SocketReader): remove do início do bytearray cada linha lida
+class LegacyReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def read_line(self):
+        start = 0
+        while True:
+            index = self.buffer.find(b"\n", start)
+            if index >= 0:
+                line = bytes(self.buffer[:index + 1])
+                del self.buffer[:index + 1]
+                return line
+            start = len(self.buffer)
+            data = next(self.chunks, b"")
+            if not data:
+                return None
+            self.buffer += data
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            self.buffer += next(self.chunks)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_message(self):
+        line = self.read_line()
+        if line is None:
+            return None, None
+        splitted_header = line.split(maxsplit=7)
+        if len(splitted_header) >= 7 and splitted_header[2] == b"FILEB":
+            return line, self.read_exact(int(splitted_header[6]))
+        return line, None
+
+
+class DecoderReader:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = protocol.FrameDecoder()
+
+    def read_message(self):
+        while True:
+            frame = self.decoder.next_frame()
+            if frame is not None:
+                return frame
+            data = next(self.chunks, b"")
+            if not data:
+                return None, None
+            self.decoder.feed(data)
+
+
+def build_stream():
+    """Fluxo de mensagens como chega num seeder: pedidos pequenos e respostas FILEB com o conteúdo binário"""
+    rng = random.Random(1)
+    parts = []
+    for i in range(STREAM_MESSAGES):
+        if rng.random() < 0.5:
+            parts.append(f"{SENDER} {i} DL 100KB.txt 1024 {i} BIN\n".encode())
+        else:
+            parts.append(f"{SENDER} {i} FILEB 100KB.txt 1024 {i} 1024\n".encode() + os.urandom(1024))
+    stream = b"".join(parts)
+    chunks = []
+    position = 0
+    while position < len(stream):
+        size = rng.randint(1, MAX_READ)
+        chunks.append(stream[position:position + size])
+        position += size
+    return chunks
+
+
+def read_all(reader_class, chunks):
+    reader = reader_class(chunks)
+    count = 0
+    while reader.read_message()[0] is not None:
+        count += 1
+    return count
+
+
+# Despacho anterior: comparações em sequência até chegar ao verbo
+VERBS = ["HELLO", "GET_PEERS", "PEER_LIST", "BYE", "LS", "LS_LIST", "DL", "DL_RANGE", "RANGE_END", "FILE",
+         "FILEB", "GOSSIP", "GOSSIP_ACK", "PING", "PONG", "FIND_NODE", "FIND_FILE", "STORE", "NODES", "FILE_HOLDERS"]
+
+
+def legacy_dispatch(verb):
+    for candidate in VERBS:
+        if verb == candidate:
+            return candidate
+
+
+def best(statement, number):
+    return min(timeit.repeat(statement, number=number, repeat=REPEAT)) / number
+
+
+def main():
+    print(f"{'Interpretação':<20} | {'Anterior (µs)':<13} | {'protocol (µs)':<13} | {'Ganho':<6}")
+    print("-" * 62)
+    for name, command in MESSAGES.items():
+        number = 2000 if len(command) > 10000 else 100000
+        old = best(lambda: legacy_parse(command), number)
+        new = best(lambda: parse(command), number)
+        print(f"{name:<20} | {old * 1e6:<13.2f} | {new * 1e6:<13.2f} | {old / new:<6.2f}")
+
+    print(f"\n{'Serialização':<20} | {'f-string (µs)':<13} | {'protocol (µs)':<13}")
+    print("-" * 52)
+    fstring = best(lambda: f"127.0.0.1:5000 {12} DL {'100KB.txt'} {4096} {17} BIN\n".encode(), 200000)
+    formatted = best(lambda: protocol.format_message("127.0.0.1", 5000, 12, "DL", "100KB.txt", 4096, 17,
+                                                     "BIN").encode(), 200000)
+    print(f"{'DL':<20} | {fstring * 1e6:<13.2f} | {formatted * 1e6:<13.2f}")
+
+    chunks = build_stream()
+    assert read_all(LegacyReader, chunks) == read_all(DecoderReader, chunks) == STREAM_MESSAGES
+    total = sum(len(chunk) for chunk in chunks)
+    print(f"\nLeitura de {STREAM_MESSAGES} mensagens ({total / 1e6:.1f} MB em {len(chunks)} recv de até {MAX_READ} bytes)")
+    print("-" * 62)
+    for name, reader_class in (("SocketReader anterior", LegacyReader), ("FrameDecoder", DecoderReader)):
+        elapsed = best(lambda: read_all(reader_class, chunks), 1)
+        print(f"{name:<22} | {elapsed * 1e3:8.1f} ms | {STREAM_MESSAGES / elapsed / 1e3:8.1f} mil mensagens/s")
+
+    registry = protocol.HandlerRegistry()
+    for verb in VERBS:
+        registry.register(verb, len)
+    print(f"\n{'Despacho':<20} | {'if/elif (µs)':<13} | {'registro (µs)':<13}")
+    print("-" * 52)
+    for verb in ("HELLO", "FILEB", "FILE_HOLDERS"):
+        old = best(lambda: legacy_dispatch(verb), 200000)
+        new = best(lambda: registry.get(verb)[0](verb), 200000)
+        print(f"{verb:<20} | {old * 1e6:<13.3f} | {new * 1e6:<13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import main as client
+from helpers import free_ports
+from peer import Peer
+
+
+DOWNLOADERS = 6              # Peers que entram no flash crowd
+FILE_SIZE = 16 * 1024 * 1024  # Tamanho do arquivo popular
+CHUNK_SIZE = 16384           # Tamanho de chunk dos downloads
+STAGGER = 0.15               # Intervalo entre a entrada de um downloader e a do seguinte [s]
+SEEDER_DELAY = 0.002         # Atraso por chunk servido pelo seeder, simulando o seu link de subida limitado [s]
+FILE_NAME = "popular.bin"
+
+
+def run(swarming):
+    base = tempfile.mkdtemp()
+    neighbors_file = os.path.join(base, "vizinhos")
+    open(neighbors_file, "w").close()
+    data = os.urandom(FILE_SIZE)
+    directories = [os.path.join(base, str(i)) for i in range(DOWNLOADERS + 1)]
+    for directory in directories:
+        os.makedirs(directory)
+    with open(os.path.join(directories[0], FILE_NAME), "wb") as file:
+        file.write(data)
+    peers = [Peer.create_peer("127.0.0.1", str(port), directory, "ONLINE", neighbors_file, CHUNK_SIZE)
+             for port, directory in zip(free_ports(len(directories)), directories)]
+    seeder = peers[0]
+    served = {id(peer): 0 for peer in peers}
+    time.sleep(0.3)
+
+    send_chunk = Peer.send_chunk
+
+    def counting(self, *args, **kwargs):
+        served[id(self)] += 1
+        if self is seeder:
+            time.sleep(SEEDER_DELAY)
+        return send_chunk(self, *args, **kwargs)
+
+    durations = []
+
+    def download(index):
+        peer = peers[index]
+        # Descobre as fontes como no menu: LS para o seeder e para quem entrou antes
+        for other in peers[:index]:
+            peer.send_command(f"{peer.ip}:{peer.port} 1 LS\n", other.ip, other.port, expect_response=True)
+        entry = peer.catalog.get(FILE_NAME, FILE_SIZE)
+        partial = set(entry.partial) if swarming else set()
+        sources = entry.live_peers() if swarming else [(seeder.ip, int(seeder.port))]
+        info = {"name": FILE_NAME, "size": str(FILE_SIZE), "peers": sources, "partial": partial}
+        started = time.monotonic()
+        peer.start_download(FILE_NAME, FILE_SIZE, CHUNK_SIZE)
+        try:
+            client.download_file_parallel(peer, info, CHUNK_SIZE)
+        finally:
+            sink = peer.finish_download(FILE_NAME)
+        durations.append(time.monotonic() - started)
+        if not sink.is_complete():
+            raise RuntimeError(f"download incompleto em {peer.port}")
+
+    Peer.send_chunk = counting
+    try:
+        threads = []
+        started = time.monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(1, DOWNLOADERS + 1):
+                thread = threading.Thread(target=download, args=(index,))
+                thread.start()
+                threads.append(thread)
+                time.sleep(STAGGER)
+            for thread in threads:
+                thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        Peer.send_chunk = send_chunk
+    for directory in directories[1:]:
+        with open(os.path.join(directory, FILE_NAME), "rb") as file:
+            if file.read() != data:
+                raise RuntimeError(f"arquivo corrompido em {directory}")
+    total = sum(served.values())
+    return elapsed, sum(durations) / len(durations), served[id(seeder)] / total, total
+
+
+def main():
+    chunks = FILE_SIZE // CHUNK_SIZE
+    print(f"{DOWNLOADERS} downloaders entrando a cada {STAGGER * 1000:.0f} ms, arquivo de {FILE_SIZE // 2 ** 20} MB "
+          f"({chunks} chunks), seeder com {SEEDER_DELAY * 1000:.0f} ms por chunk\n")
+    print(f"{'Cenário':<22} | {'Total (s)':<9} | {'Download médio (s)':<18} | {'Servido pelo seeder':<19}")
+    print("-" * 78)
+    for name, swarming in (("só o seeder", False), ("com download parcial", True)):
+        elapsed, average, seeder_share, total = run(swarming)
+        print(f"{name:<22} | {elapsed:<9.2f} | {average:<18.2f} | {seeder_share:<19.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import bisect
+import threading
+import time
+
+
+CATALOG_TTL = 300.0  # Tempo que um anúncio de arquivo (LS_LIST) vale sem ser renovado [s]
+
+
+# Arquivo anunciado na rede: identificado por nome e tamanho, com os peers que o têm e a validade de cada anúncio
+class CatalogEntry:
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.peers = {}  # (ip, porta) -> instante em que o anúncio expira
+        self.partial = set()  # Peers que anunciaram o arquivo ainda em download (têm só parte dos chunks)
+
+    def live_peers(self, now=None):
+        now = time.monotonic() if now is None else now
+        return sorted(peer for peer, expires in self.peers.items() if expires > now)
+
+
+# Catálogo dos arquivos anunciados pelos vizinhos, indexado por (nome, tamanho). Mantém também os nomes ordenados,
+# para buscas por prefixo em O(log n), e os arquivos de cada peer, para retirá-lo do catálogo quando ele sai.
+class FileCatalog:
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self.entries = {}       # (nome, tamanho) -> CatalogEntry
+        self.by_name = {}       # nome -> tamanhos anunciados
+        self.by_peer = {}       # (ip, porta) -> chaves dos arquivos anunciados pelo peer
+        self.sorted_names = []
+        self.names_dirty = False
+        self.next_expiry = float("inf")  # Nenhum anúncio expira antes disso: purge não precisa percorrer o catálogo
+        self.lock = threading.Lock()
+
+    def add(self, name, size, peer, partial=False):
+        """Registra (ou renova) o anúncio de um arquivo por um peer; partial indica um download em andamento"""
+        key = (name, int(size))
+        peer = (peer[0], int(peer[1]))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = CatalogEntry(*key)
+                sizes = self.by_name.setdefault(name, set())
+                if not sizes:
+                    self.names_dirty = True
+                sizes.add(key[1])
+            expires = time.monotonic() + self.ttl
+            entry.peers[peer] = expires
+            if partial:
+                entry.partial.add(peer)
+            else:
+                entry.partial.discard(peer)
+            self.next_expiry = min(self.next_expiry, expires)
+            self.by_peer.setdefault(peer, set()).add(key)
+
+    def remove_peer(self, peer):
+        """Retira todos os anúncios de um peer (ex.: quando ele sai da rede)"""
+        peer = (peer[0], int(peer[1]))
+        with self.lock:
+            for key in self.by_peer.pop(peer, ()):
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.peers.pop(peer, None)
+                    entry.partial.discard(peer)
+                    if not entry.peers:
+                        self._remove(key)
+
+    def get(self, name, size):
+        with self.lock:
+            return self.entries.get((name, int(size)))
+
+    def keys(self):
+        """(nome, tamanho) de todos os arquivos do catálogo"""
+        with self.lock:
+            return set(self.entries)
+
+    def peer_files(self, peer):
+        """Arquivos anunciados pelo peer, por nome e tamanho"""
+        peer = (peer[0], int(peer[1]))
+        with self.lock:
+            return [self.entries[key] for key in sorted(self.by_peer.get(peer, ())) if key in self.entries]
+
+    def search(self, query="", prefix=False):
+        """Arquivos com anúncios válidos cujo nome contém query (ou começa com query, se prefix), por nome"""
+        with self.lock:
+            self._purge()
+            if self.names_dirty:
+                self.sorted_names = sorted(self.by_name)
+                self.names_dirty = False
+            if prefix or not query:
+                start = bisect.bisect_left(self.sorted_names, query)
+                end = bisect.bisect_left(self.sorted_names, query + "\U0010ffff")
+                names = self.sorted_names[start:end]
+            else:
+                names = [name for name in self.sorted_names if query in name]
+            return [self.entries[(name, size)] for name in names for size in sorted(self.by_name[name])]
+
+    def _purge(self):
+        # Descarta anúncios expirados; chamado com o lock adquirido
+        now = time.monotonic()
+        if now < self.next_expiry:
+            return
+        self.next_expiry = float("inf")
+        for key, entry in list(self.entries.items()):
+            expired = [peer for peer, expires in entry.peers.items() if expires <= now]
+            for peer in expired:
+                del entry.peers[peer]
+                entry.partial.discard(peer)
+                keys = self.by_peer.get(peer)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.by_peer[peer]
+            if entry.peers:
+                self.next_expiry = min(self.next_expiry, min(entry.peers.values()))
+            else:
+                self._remove(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _remove(self, key):
+        del self.entries[key]
+        sizes = self.by_name[key[0]]
+        sizes.discard(key[1])
+        if not sizes:
+            del self.by_name[key[0]]
+            self.names_dirty = True
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+
+
+CHUNK_CACHE_BYTES = 64 * 1024 * 1024     # Memória total dos chunks guardados no cache
+CHUNK_CACHE_MAX_ENTRY = 1024 * 1024      # Maior chunk guardado; os maiores são lidos e codificados a cada envio
+
+
+# Cache LRU, limitado em bytes, dos chunks já lidos pelo servidor na forma em que são enviados: comprimidos ou não,
+# e codificados em base64 no modo texto. Num flash crowd todos os peers pedem os mesmos chunks do mesmo arquivo, que
+# passam a ser servidos da memória. A chave inclui a versão do arquivo (mtime e tamanho): quando ele muda, os chunks
+# da versão anterior são descartados.
+class ChunkCache:
+    def __init__(self, capacity=CHUNK_CACHE_BYTES, max_entry=CHUNK_CACHE_MAX_ENTRY):
+        self.capacity = capacity
+        self.max_entry = max_entry
+        self.entries = OrderedDict()  # (nome, tamanho do chunk, índice, forma) -> (compressão ou None, conteúdo)
+        self.by_file = {}             # nome -> chaves dos chunks guardados
+        self.versions = {}            # nome -> (mtime, tamanho) dos chunks guardados
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, name, version, chunk_size, chunk_index, form):
+        """Chunk guardado para essa versão do arquivo, ou None"""
+        key = (name, chunk_size, chunk_index, form)
+        with self.lock:
+            if self.versions.get(name) != version:
+                self._drop(name)
+                self.misses += 1
+                return None
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, name, version, chunk_size, chunk_index, form, entry):
+        if len(entry[1]) > self.max_entry:
+            return
+        key = (name, chunk_size, chunk_index, form)
+        with self.lock:
+            if self.versions.get(name) != version:
+                self._drop(name)
+                self.versions[name] = version
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = entry
+            self.by_file.setdefault(name, set()).add(key)
+            self.size += len(entry[1])
+            while self.size > self.capacity:
+                evicted, evicted_entry = self.entries.popitem(last=False)
+                self.size -= len(evicted_entry[1])
+                keys = self.by_file[evicted[0]]
+                keys.discard(evicted)
+                if not keys:
+                    del self.by_file[evicted[0]]
+                    del self.versions[evicted[0]]
+
+    def invalidate(self, name):
+        """Descarta os chunks de um arquivo (ex.: quando ele é substituído por este peer)"""
+        with self.lock:
+            self._drop(name)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.size}
+
+    def _drop(self, name):
+        # Chamado com o lock adquirido
+        for key in self.by_file.pop(name, ()):
+            self.size -= len(self.entries.pop(key)[1])
+        self.versions.pop(name, None)
@@ -0,0 +1,123 @@
+import threading
+import zlib
+
+# Compressores opcionais: usados quando instalados, nos dois lados da transferência
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+ZLIB_LEVEL = 6           # Nível do zlib: bem mais rápido que o 9, com compressão quase igual em texto
+ZSTD_LEVEL = 3           # Nível padrão do zstd
+MIN_COMPRESS_SIZE = 128  # Chunks menores vão sem compressão (o cabeçalho do formato come o ganho)
+MIN_SAVING = 0.1         # Fração mínima economizada para valer a pena mandar o chunk comprimido
+RATIO_ALPHA = 0.2        # Peso de um chunk novo na média móvel da razão de compressão de um arquivo
+PROBE_INTERVAL = 64      # Num arquivo que não comprime, chunks enviados sem tentar antes de medir de novo
+OPTION_PREFIX = "COMP="  # Opção de um pedido DL/DL_RANGE com os compressores aceitos, em ordem de preferência
+
+
+def _zlib_decompress(data, max_size):
+    decompressor = zlib.decompressobj()
+    result = decompressor.decompress(data, max_size)
+    if decompressor.unconsumed_tail:
+        raise ValueError("chunk descomprimido maior que o tamanho de chunk")
+    return result
+
+
+def _lz4_decompress(data, max_size):
+    # Pede um byte além do limite: um chunk do tamanho exato ainda chega ao fim do frame, e um maior para ali
+    decompressor = lz4.frame.LZ4FrameDecompressor()
+    result = decompressor.decompress(data, max_length=max_size + 1)
+    if not decompressor.eof:
+        raise ValueError("chunk descomprimido maior que o tamanho de chunk ou incompleto")
+    return result
+
+
+def _zstd_decompress(data, max_size):
+    return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_size)
+
+
+# nome -> (comprimir, descomprimir com limite de tamanho), do preferido ao menos preferido
+CODECS = {}
+if zstandard is not None:
+    CODECS["zstd"] = (lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), _zstd_decompress)
+if lz4 is not None:
+    CODECS["lz4"] = (lz4.frame.compress, _lz4_decompress)
+CODECS["zlib"] = (lambda data: zlib.compress(data, ZLIB_LEVEL), _zlib_decompress)
+
+
+def request_option():
+    """Opção acrescentada aos pedidos de chunks, com os compressores deste peer"""
+    return OPTION_PREFIX + ",".join(CODECS)
+
+
+def negotiate(options):
+    """Compressor a usar na resposta: o primeiro dos aceitos pelo cliente que este peer tem, ou None"""
+    for option in options:
+        if option.startswith(OPTION_PREFIX):
+            for name in option[len(OPTION_PREFIX):].split(","):
+                if name in CODECS:
+                    return name
+    return None
+
+
+def decompress(codec, data, max_size):
+    if codec not in CODECS:
+        raise ValueError(f"compressão desconhecida: {codec}")
+    data = CODECS[codec][1](data, max_size)
+    if len(data) > max_size:
+        raise ValueError("chunk descomprimido maior que o tamanho de chunk")
+    return data
+
+
+# Decide, por arquivo, se vale comprimir: guarda a média móvel da razão (comprimido / original) dos chunks de
+# cada arquivo e deixa de comprimir os que não diminuem, tentando de novo a cada PROBE_INTERVAL chunks
+class CompressionPolicy:
+    def __init__(self):
+        self.ratios = {}      # arquivo -> média móvel da razão de compressão
+        self.skipped = {}     # arquivo -> chunks enviados sem tentar desde a última medição
+        self.raw_bytes = 0    # Bytes dos chunks antes da compressão
+        self.sent_bytes = 0   # Bytes efetivamente enviados no lugar deles
+        self.lock = threading.Lock()
+
+    def compress(self, file_name, codec, data):
+        """Retorna (compressor usado ou None, conteúdo): o chunk original quando comprimir não compensa"""
+        if codec is None or len(data) < MIN_COMPRESS_SIZE or not self._should_try(file_name):
+            self._count(len(data), len(data))
+            return None, data
+        compressed = CODECS[codec][0](data)
+        ratio = len(compressed) / len(data)
+        with self.lock:
+            previous = self.ratios.get(file_name)
+            self.ratios[file_name] = ratio if previous is None else previous + RATIO_ALPHA * (ratio - previous)
+        if ratio > 1 - MIN_SAVING:
+            self._count(len(data), len(data))
+            return None, data
+        self._count(len(data), len(compressed))
+        return codec, compressed
+
+    def stats(self):
+        with self.lock:
+            return {"raw": self.raw_bytes, "sent": self.sent_bytes,
+                    "skipped_files": sum(1 for ratio in self.ratios.values() if ratio > 1 - MIN_SAVING)}
+
+    def _should_try(self, file_name):
+        with self.lock:
+            ratio = self.ratios.get(file_name)
+            if ratio is None or ratio <= 1 - MIN_SAVING:
+                return True
+            skipped = self.skipped.get(file_name, 0) + 1
+            if skipped >= PROBE_INTERVAL:
+                skipped = 0
+            self.skipped[file_name] = skipped
+            return skipped == 0
+
+    def _count(self, raw, sent):
+        with self.lock:
+            self.raw_bytes += raw
+            self.sent_bytes += sent
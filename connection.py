@@ -0,0 +1,193 @@
+import os
+import socket
+import threading
+import time
+import selectors
+from protocol import FrameDecoder
+
+
+POOL_MAX_IDLE = 16         # Conexões ociosas mantidas por vizinho (uma por requisição simultânea do escalonador)
+POOL_IDLE_TIMEOUT = 30.0   # Segundos até descartar uma conexão ociosa do pool
+CONNECT_TIMEOUT = 5.0      # Tempo máximo para estabelecer uma conexão
+RESPONSE_TIMEOUT = 10.0    # Tempo máximo esperando a resposta de um comando
+SERVER_IDLE_TIMEOUT = 60.0 # Tempo que o servidor mantém uma conexão ociosa aberta
+SERVER_IO_TIMEOUT = 30.0   # Prazo de cada envio do servidor, e da leitura de uma mensagem que já começou a chegar
+RTT_ALPHA = 0.3            # Peso da nova amostra na média móvel do RTT de cada vizinho
+
+# poll não tem o limite do select (descritores abaixo de FD_SETSIZE, 1024), que um peer com muitas conexões,
+# arquivos mapeados e downloads abertos ultrapassa; onde não existe, o selectors escolhe a alternativa
+WAIT_SELECTOR = getattr(selectors, "PollSelector", selectors.DefaultSelector)
+
+
+def wait_ready(sock, events, timeout):
+    """Espera até timeout o socket ficar pronto para os eventos dados; retorna se ficou"""
+    with WAIT_SELECTOR() as selector:
+        selector.register(sock, events)
+        return bool(selector.select(timeout))
+
+
+# Envia count bytes do arquivo a partir de offset direto do page cache para o socket, sem cópias em espaço de usuário.
+# Usa o offset explícito do sendfile, sem mexer na posição do arquivo. Em conexões que não são sockets
+# (ex.: streams asyncio) ou sistemas sem os.sendfile, lê o trecho e usa sendall.
+def send_file_range(sock, file, offset, count):
+    if not isinstance(sock, socket.socket) or not hasattr(os, "sendfile"):
+        file.seek(offset)
+        sock.sendall(file.read(count))
+        return
+
+    in_fd = file.fileno()
+    out_fd = sock.fileno()
+    timeout = sock.gettimeout()
+    while count > 0:
+        try:
+            sent = os.sendfile(out_fd, in_fd, offset, count)
+        except BlockingIOError:
+            # Sockets com timeout ficam em modo não bloqueante: espera o buffer de envio liberar espaço
+            if not wait_ready(sock, selectors.EVENT_WRITE, timeout):
+                raise socket.timeout("tempo esgotado enviando o arquivo")
+            continue
+        if sent == 0:
+            raise ConnectionError("arquivo terminou antes do esperado")
+        offset += sent
+        count -= sent
+
+
+# Classe que lê as mensagens de um socket com um FrameDecoder: cada recv entrega o que chegou, e o que sobrar de
+# uma mensagem fica no buffer para a próxima leitura
+class SocketReader:
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = FrameDecoder()
+
+    def read_message(self):
+        """Retorna (linha, conteúdo binário ou None) da próxima mensagem, ou (None, None) se a conexão foi encerrada"""
+        while True:
+            frame = self.decoder.next_frame()
+            if frame is not None:
+                return frame
+            data = self.sock.recv(max(65536, self.decoder.missing()))
+            if not data:
+                line = self.decoder.finish()
+                return (line, None) if line is not None else (None, None)
+            self.decoder.feed(data)
+
+
+# Conexão aceita pelo servidor, com o leitor associado. Entre uma mensagem e outra fica no dispatcher do servidor,
+# sem ocupar um worker.
+class ServerConnection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = SocketReader(sock)
+        self.last_used = time.monotonic()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# Conexão TCP mantida pelo pool, com o leitor associado
+class PooledConnection:
+    def __init__(self, key, sock):
+        self.key = key
+        self.sock = sock
+        self.reader = SocketReader(sock)
+        self.last_used = time.monotonic()
+        self.reused = False
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# Pool de conexões keep-alive por vizinho, com limite de conexões ociosas e expiração por inatividade
+class ConnectionPool:
+    def __init__(self, max_idle=POOL_MAX_IDLE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT, response_timeout=RESPONSE_TIMEOUT):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.response_timeout = response_timeout
+        self.idle = {}
+        self.rtt = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, ip, port, timeout=None):
+        """Retorna uma conexão ociosa para (ip, port) ou abre uma nova, esperando no máximo timeout para conectar"""
+        key = (ip, int(port))
+        now = time.monotonic()
+        while True:
+            with self.lock:
+                connections = self.idle.get(key)
+                conn = connections.pop() if connections else None
+            if conn is None:
+                break
+            if now - conn.last_used > self.idle_timeout or not self._is_alive(conn):
+                conn.close()
+                continue
+            conn.reused = True
+            return conn
+
+        started = time.monotonic()
+        connect_timeout = min(timeout, self.connect_timeout) if timeout else self.connect_timeout
+        sock = socket.create_connection(key, timeout=connect_timeout)
+        # O handshake TCP leva um RTT: serve de medição para a escolha do tamanho de chunk
+        self.record_rtt(key, time.monotonic() - started)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.response_timeout)
+        return PooledConnection(key, sock)
+
+    def record_rtt(self, key, sample):
+        previous = self.rtt.get(key)
+        self.rtt[key] = sample if previous is None else previous + RTT_ALPHA * (sample - previous)
+
+    def release(self, conn):
+        """Devolve a conexão ao pool, fechando-a se o limite de ociosas já foi atingido"""
+        conn.last_used = time.monotonic()
+        with self.lock:
+            self._evict_expired(conn.last_used)
+            connections = self.idle.setdefault(conn.key, [])
+            if len(connections) < self.max_idle:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def discard(self, conn):
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            connections = [c for conns in self.idle.values() for c in conns]
+            self.idle.clear()
+        for conn in connections:
+            conn.close()
+
+    def _evict_expired(self, now):
+        # Chamado com o lock adquirido
+        for key in list(self.idle):
+            alive = []
+            for conn in self.idle[key]:
+                if now - conn.last_used > self.idle_timeout:
+                    conn.close()
+                else:
+                    alive.append(conn)
+            if alive:
+                self.idle[key] = alive
+            else:
+                del self.idle[key]
+
+    @staticmethod
+    def _is_alive(conn):
+        # Uma conexão ociosa legível só pode ter recebido EOF (peer fechou) ou lixo: em ambos os casos é descartada
+        if conn.reader.decoder.buffered():
+            return False
+        try:
+            return not wait_ready(conn.sock, selectors.EVENT_READ, 0)
+        except (OSError, ValueError):
+            return False
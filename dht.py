@@ -0,0 +1,279 @@
+import hashlib
+import logging
+import protocol
+import threading
+import time
+
+
+ID_BITS = 160                # Tamanho dos identificadores (SHA-1)
+K = 8                        # Nós por k-bucket e réplicas de cada registro
+ALPHA = 3                    # Consultas em paralelo a cada passo de uma busca
+DHT_TIMEOUT = 1.0            # Prazo de uma consulta a um nó [s]
+LOCATE_DEADLINE = 1.0        # Prazo total de uma busca de arquivo (locate), que atrasa o LS quando não acha nada [s]
+RECORD_TTL = 3600.0          # Validade de um registro guardado sem ser republicado [s]
+REPUBLISH_INTERVAL = 1200.0  # Intervalo entre republicações dos arquivos compartilhados [s]
+
+logger = logging.getLogger(__name__)
+
+
+# Identificador de um nó: derivado do endereço, então qualquer peer conhecido já tem o id calculável
+def node_id(ip, port):
+    return int.from_bytes(hashlib.sha1(f"{ip}:{port}".encode()).digest(), "big")
+
+
+# Chave de um arquivo na DHT: derivada só do nome, para ser encontrada por quem sabe o nome exato
+def key_id(file_name):
+    return int.from_bytes(hashlib.sha1(file_name.encode()).digest(), "big")
+
+
+# Tabela de roteamento com um k-bucket por bit de distância (XOR) ao próprio nó. Cada bucket guarda até K nós,
+# do visto há mais tempo para o mais recente; com o bucket cheio os nós antigos são mantidos, como no Kademlia,
+# e só saem quando deixam de responder.
+class RoutingTable:
+    def __init__(self, own_id):
+        self.own_id = own_id
+        self.buckets = [[] for _ in range(ID_BITS)]
+        self.lock = threading.Lock()
+
+    def _bucket(self, node):
+        distance = node_id(*node) ^ self.own_id
+        return self.buckets[distance.bit_length() - 1] if distance else None
+
+    def add(self, node):
+        with self.lock:
+            bucket = self._bucket(node)
+            if bucket is None:
+                return
+            if node in bucket:
+                bucket.remove(node)
+                bucket.append(node)
+            elif len(bucket) < K:
+                bucket.append(node)
+
+    def remove(self, node):
+        with self.lock:
+            bucket = self._bucket(node)
+            if bucket is not None and node in bucket:
+                bucket.remove(node)
+
+    def closest(self, target, count=K):
+        with self.lock:
+            nodes = [node for bucket in self.buckets for node in bucket]
+        return sorted(nodes, key=lambda node: node_id(*node) ^ target)[:count]
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets)
+
+
+# Estado de uma busca iterativa: os nós conhecidos mais próximos do alvo e o que já foi consultado
+class Lookup:
+    def __init__(self, target, nodes):
+        self.target = target
+        self.candidates = set(nodes)
+        self.queried = set()
+        self.holders = set()  # (nome, tamanho, (ip, porta)) recebidos em FILE_HOLDERS
+        self.lock = threading.Lock()
+
+    def add_nodes(self, nodes):
+        with self.lock:
+            self.candidates.update(nodes)
+
+    def drop(self, node):
+        with self.lock:
+            self.candidates.discard(node)
+
+    def next_nodes(self):
+        """Até ALPHA nós ainda não consultados entre os K candidatos mais próximos; vazio quando a busca convergiu"""
+        with self.lock:
+            closest = sorted(self.candidates, key=lambda node: node_id(*node) ^ self.target)[:K]
+            pending = [node for node in closest if node not in self.queried][:ALPHA]
+            self.queried.update(pending)
+            return pending
+
+    def closest(self):
+        with self.lock:
+            responded = [node for node in self.candidates if node in self.queried]
+            return sorted(responded, key=lambda node: node_id(*node) ^ self.target)[:K]
+
+
+# Camada de DHT estilo Kademlia sobre os endereços e mensagens do peer. Cada arquivo compartilhado é publicado
+# (STORE) nos K nós com id mais próximo da chave do nome, e encontrar quem tem um arquivo leva O(log N) passos de
+# FIND_FILE, em vez de um LS a todos os vizinhos.
+#   FIND_NODE <alvo>             -> NODES <alvo> <n> ip:porta ...
+#   FIND_FILE <nome>             -> FILE_HOLDERS <nome> <n> nome:tamanho:ip:porta ... (ou NODES, se não souber)
+#   STORE <nome> <tamanho> <ip:porta>
+class DHT:
+    def __init__(self, peer):
+        self.peer = peer
+        self.own = (peer.ip, int(peer.port))
+        self.table = RoutingTable(node_id(*self.own))
+        self.records = {}   # chave -> {(nome, tamanho, (ip, porta)): instante em que expira}
+        self.lookups = {}   # alvo -> buscas em andamento, que recebem as respostas
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    # Tratadores das mensagens da DHT, registrados por Peer.register_handlers; as consultas respondem na mesma conexão
+    def handle_find_node(self, message, conn):
+        sender = message.sender
+        target_hex = message.args[0]
+        self.table.add(sender)
+        target = int(target_hex, 16)
+        self.peer.reply(conn, "NODES", target_hex, self._format_nodes(self.table.closest(target), sender))
+
+    def handle_find_file(self, message, conn):
+        sender = message.sender
+        file_name = message.args[0]
+        self.table.add(sender)
+        holders = self.local_holders(file_name)
+        if holders:
+            entries = [f"{name}:{size}:{ip}:{port}" for name, size, (ip, port) in holders]
+            self.peer.reply(conn, "FILE_HOLDERS", file_name, len(entries), *entries)
+            return
+        target = key_id(file_name)
+        self.peer.reply(conn, "NODES", f"{target:040x}", self._format_nodes(self.table.closest(target), sender))
+
+    def handle_store(self, message, conn):
+        file_name, size, holder = message.args[:3]
+        holder_ip, holder_port = holder.rsplit(":", 1)
+        self.table.add(message.sender)
+        self.store(file_name, int(size), (holder_ip, holder_port))
+
+    def handle_nodes(self, message, conn):
+        target_hex, fields = message.args[0], message.args[1:]
+        self.table.add(message.sender)
+        nodes = []
+        for entry in fields[1:1 + int(fields[0])] if fields else []:
+            ip, _, port = entry.rpartition(":")
+            if port.isdigit() and (ip, int(port)) != self.own:
+                nodes.append((ip, int(port)))
+        for node in nodes:
+            self.table.add(node)
+        for lookup in self._lookups_for(int(target_hex, 16)):
+            lookup.add_nodes(nodes)
+
+    def handle_file_holders(self, message, conn):
+        file_name, fields = message.args[0], message.args[1:]
+        self.table.add(message.sender)
+        holders = set()
+        for entry in fields[1:1 + int(fields[0])] if fields else []:
+            parts = entry.split(":")
+            if len(parts) == 4 and parts[1].isdigit() and parts[3].isdigit():
+                holders.add((parts[0], int(parts[1]), (parts[2], int(parts[3]))))
+        for lookup in self._lookups_for(key_id(file_name)):
+            with lookup.lock:
+                lookup.holders.update(holders)
+
+    def store(self, file_name, size, holder):
+        with self.lock:
+            records = self.records.setdefault(key_id(file_name), {})
+            records[(file_name, int(size), (holder[0], int(holder[1])))] = time.monotonic() + RECORD_TTL
+
+    def local_holders(self, file_name):
+        now = time.monotonic()
+        with self.lock:
+            records = self.records.get(key_id(file_name), {})
+            for record in [r for r, expires in records.items() if expires <= now]:
+                del records[record]
+            return [record for record in records if record[0] == file_name]
+
+    def find_nodes(self, target):
+        """Os K nós mais próximos de target na rede"""
+        return self._iterative_lookup(target, ("FIND_NODE", f"{target:040x}")).closest()
+
+    def locate(self, file_name, deadline=LOCATE_DEADLINE):
+        """Quem tem o arquivo, como (nome, tamanho, (ip, porta)), encontrado em O(log N) passos. Para em deadline
+        segundos com o que tiver encontrado: nós fora do ar custam DHT_TIMEOUT a cada passo."""
+        holders = set(self.local_holders(file_name))
+        lookup = self._iterative_lookup(key_id(file_name), ("FIND_FILE", file_name), stop_on_holders=True,
+                                        deadline=deadline)
+        return sorted(holders | lookup.holders)
+
+    def publish(self, file_name, size):
+        """Guarda o registro "este peer tem o arquivo" nos K nós mais próximos da chave do nome"""
+        nodes = self.find_nodes(key_id(file_name))
+        # O próprio nó também guarda o registro se estiver entre os mais próximos (ou se a rede for só ele)
+        own_distance = self.table.own_id ^ key_id(file_name)
+        if len(nodes) < K or own_distance < max(node_id(*node) ^ key_id(file_name) for node in nodes):
+            self.store(file_name, size, self.own)
+        for node in nodes:
+            self._send(node, False, "STORE", file_name, size, f"{self.own[0]}:{self.own[1]}")
+
+    # request: (verbo, argumentos...) da consulta enviada a cada nó
+    def _iterative_lookup(self, target, request, stop_on_holders=False, deadline=None):
+        lookup = Lookup(target, self.table.closest(target))
+        end = None if deadline is None else time.monotonic() + deadline
+        with self.lock:
+            self.lookups.setdefault(target, []).append(lookup)
+        try:
+            while end is None or time.monotonic() < end:
+                nodes = lookup.next_nodes()
+                if not nodes:
+                    break
+                # ALPHA consultas em paralelo; as respostas chegam em handle_nodes/handle_file_holders. No prazo, as
+                # que ainda não responderam são abandonadas (as respostas que chegarem depois são ignoradas).
+                threads = [threading.Thread(target=self._query, args=(lookup, request, node), daemon=True)
+                           for node in nodes]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join(None if end is None else max(0.0, end - time.monotonic()))
+                if stop_on_holders and lookup.holders:
+                    break
+        finally:
+            with self.lock:
+                self.lookups[target].remove(lookup)
+                if not self.lookups[target]:
+                    del self.lookups[target]
+        return lookup
+
+    def _query(self, lookup, request, node):
+        # Nós cujos heartbeats pararam não são consultados
+        if self.peer.detector.is_down(node) or not self._send(node, True, *request):
+            # Nós que não respondem saem da tabela e da busca
+            self.table.remove(node)
+            lookup.drop(node)
+
+    def _lookups_for(self, target):
+        with self.lock:
+            return list(self.lookups.get(target, ()))
+
+    def _send(self, node, expect_response, verb, *args):
+        # Mensagens periódicas da DHT não são impressas, como as de gossip
+        message = protocol.format_message(self.peer.ip, self.peer.port, self.peer.clock.tick(), verb, *args)
+        return self.peer.send_command(message, node[0], node[1], expect_response=expect_response,
+                                      timeout=DHT_TIMEOUT, quiet=True)
+
+    def _format_nodes(self, nodes, exclude):
+        nodes = [node for node in nodes if node != exclude]
+        return f"{len(nodes)} {' '.join(f'{ip}:{port}' for ip, port in nodes)}"
+
+    def bootstrap(self):
+        """Entra na rede pelos vizinhos conhecidos, procurando o próprio id para preencher a tabela"""
+        for neighbor in self.peer.neighbors:
+            self.table.add(neighbor.key)
+        self.find_nodes(self.table.own_id)
+
+    def publish_all(self):
+        self.peer.shared_index.listing()
+        for file_name, size in list(self.peer.shared_index.entries.items()):
+            self.publish(file_name, size)
+
+    def start(self, republish_interval=REPUBLISH_INTERVAL):
+        def maintenance_thread():
+            while True:
+                try:
+                    self.bootstrap()
+                    self.publish_all()
+                except Exception as e:
+                    logger.error("[Erro] Falha na manutenção da DHT: %s", e)
+                if self.stop_event.wait(republish_interval):
+                    return
+
+        threading.Thread(target=maintenance_thread, daemon=True).start()
+
+    def announce(self, file_name, size):
+        """Publica um arquivo novo (ex.: um download concluído) sem esperar a próxima republicação"""
+        threading.Thread(target=self.publish, args=(file_name, size), daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
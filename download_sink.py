@@ -0,0 +1,225 @@
+import os
+import json
+import threading
+import time
+
+
+PART_SUFFIX = ".part"          # Sufixo do arquivo enquanto o download não termina
+MANIFEST_SUFFIX = ".manifest"  # Sufixo do manifesto que permite retomar um download interrompido
+MANIFEST_SYNC_INTERVAL = 1.0   # Intervalo mínimo entre fsyncs do arquivo e do manifesto durante o download [s]
+
+
+# Destino de um download: o arquivo é pré-alocado e cada chunk é escrito direto na sua posição assim que chega.
+# Os chunks recebidos ficam marcados num bitmap (1 bit por chunk), espelhado num manifesto ao lado do .part:
+# uma linha JSON com nome, tamanho e tamanho de chunk, seguida do bitmap, que é regravado a cada fsync dos dados.
+# Se o download for interrompido, criar o destino de novo com o mesmo arquivo retoma de onde parou.
+class DownloadSink:
+    def __init__(self, directory, file_name, file_size, chunk_size):
+        self.file_name = file_name
+        self.file_size = file_size
+        self.final_path = os.path.join(directory, file_name)
+        self.path = self.final_path + PART_SUFFIX
+        self.manifest_path = self.path + MANIFEST_SUFFIX
+        self.lock = threading.RLock()
+        self.sync_lock = threading.Lock()
+        self.writes_done = threading.Condition(self.lock)
+        self.writers = 0      # Chunks sendo escritos fora do lock; close espera todos terminarem
+        self.closing = False  # close começou: não aceita mais chunks, mas ainda serve os já recebidos
+        self.dirty = set()    # Bytes do bitmap com chunks marcados que ainda não foram para o manifesto
+        self.last_sync = time.monotonic()
+        self.closed = False
+
+        # Um manifesto do mesmo arquivo define o tamanho de chunk, já que o bitmap foi gravado com ele
+        manifest = self.read_manifest(self.manifest_path)
+        if (manifest is not None and os.path.exists(self.path)
+                and manifest["name"] == file_name and manifest["size"] == file_size):
+            self.chunk_size = manifest["chunk_size"]
+            self._init_bitmap()
+            self.bitmap[:] = manifest["bitmap"]
+            self.completed = sum(1 for i in range(self.total_chunks) if self.has_chunk(i))
+        else:
+            self.chunk_size = chunk_size
+            self._init_bitmap()
+            self.completed = 0
+        self.resumed = self.completed
+
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        os.ftruncate(self.fd, file_size)
+        if file_size > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self.fd, 0, file_size)
+            except OSError:
+                # Sistemas de arquivos sem suporte continuam com o arquivo esparso do ftruncate
+                pass
+        self._write_manifest()
+
+    def _init_bitmap(self):
+        self.total_chunks = (self.file_size + self.chunk_size - 1) // self.chunk_size
+        self.bitmap = bytearray((self.total_chunks + 7) // 8)
+
+    @staticmethod
+    def read_manifest(path):
+        """Lê um manifesto, retornando None se não existir ou estiver corrompido"""
+        try:
+            with open(path, "rb") as manifest_file:
+                header = json.loads(manifest_file.readline())
+                bitmap = manifest_file.read()
+            total_chunks = (header["size"] + header["chunk_size"] - 1) // header["chunk_size"]
+        except (OSError, ValueError, KeyError, TypeError, ZeroDivisionError):
+            return None
+        if len(bitmap) != (total_chunks + 7) // 8:
+            return None
+        header["bitmap"] = bitmap
+        return header
+
+    def chunk_length(self, chunk_index):
+        return min(self.chunk_size, self.file_size - chunk_index * self.chunk_size)
+
+    def has_chunk(self, chunk_index):
+        return bool(self.bitmap[chunk_index >> 3] & (1 << (chunk_index & 7)))
+
+    def write_chunk(self, chunk_index, data) -> bool:
+        """Escreve o chunk na sua posição do arquivo e o marca no bitmap (o manifesto é atualizado no próximo fsync);
+        retorna False se for inválido ou repetido"""
+        if not 0 <= chunk_index < self.total_chunks or len(data) != self.chunk_length(chunk_index):
+            return False
+        with self.lock:
+            # Chunks atrasados (ex.: a cópia perdedora de um hedging) chegam a um destino que pode já estar fechado
+            if self.closing or self.has_chunk(chunk_index):
+                return False
+            self.writers += 1
+        try:
+            self._pwrite(self.fd, data, chunk_index * self.chunk_size)
+        finally:
+            with self.lock:
+                self.writers -= 1
+                if not self.writers:
+                    self.writes_done.notify_all()
+        with self.lock:
+            if self.has_chunk(chunk_index):
+                return False
+            self.bitmap[chunk_index >> 3] |= 1 << (chunk_index & 7)
+            self.completed += 1
+            self.dirty.add(chunk_index >> 3)
+            sync = time.monotonic() - self.last_sync >= MANIFEST_SYNC_INTERVAL
+            if sync:
+                self.last_sync = time.monotonic()
+        if sync:
+            self._sync()
+        return True
+
+    def read_chunk(self, chunk_index):
+        if not self.has_chunk(chunk_index):
+            return None
+        return self._pread(self.chunk_length(chunk_index), chunk_index * self.chunk_size)
+
+    def has_range(self, offset, length):
+        """Se todos os chunks que cobrem os bytes [offset, offset + length) já foram escritos"""
+        if offset < 0 or length <= 0 or offset + length > self.file_size:
+            return False
+        return all(self.has_chunk(i) for i in range(offset // self.chunk_size,
+                                                    (offset + length - 1) // self.chunk_size + 1))
+
+    def read_range(self, offset, length):
+        """Lê bytes já recebidos (para servir outros peers durante o download); None se faltam ou se já foi fechado"""
+        with self.lock:
+            # Sob o lock, para não ler de um descritor fechado (e talvez reaproveitado) por close
+            if self.closed or not self.has_range(offset, length):
+                return None
+            return self._pread(length, offset)
+
+    def bitmap_snapshot(self):
+        with self.lock:
+            return bytes(self.bitmap)
+
+    def missing_chunks(self):
+        return [i for i in range(self.total_chunks) if not self.has_chunk(i)]
+
+    def is_complete(self):
+        return self.completed == self.total_chunks
+
+    def close(self) -> bool:
+        """Faz o fsync e fecha o arquivo; se o download terminou, move o .part para o nome final e apaga o manifesto"""
+        with self.lock:
+            self.closing = True
+            while self.writers:
+                self.writes_done.wait()
+        try:
+            self._sync()
+        finally:
+            with self.lock:
+                self.closed = True
+                os.close(self.fd)
+                os.close(self.manifest_fd)
+        if self.is_complete():
+            os.replace(self.path, self.final_path)
+            os.remove(self.manifest_path)
+            return True
+        return False
+
+    def _write_manifest(self):
+        header = json.dumps({"name": self.file_name, "size": self.file_size, "chunk_size": self.chunk_size})
+        header = header.encode() + b"\n"
+        self.bitmap_offset = len(header)
+        # Escreve num arquivo temporário e renomeia, para não deixar um manifesto pela metade
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "wb") as manifest_file:
+            manifest_file.write(header + self.bitmap)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(temp_path, self.manifest_path)
+        self.manifest_fd = os.open(self.manifest_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+
+    def _sync(self):
+        # Os bits só vão para o manifesto depois do fsync dos dados que eles marcam: mesmo numa queda de energia, e
+        # não só se o processo morrer, o manifesto nunca marca um chunk que não está no disco. Chunks recebidos
+        # depois do último fsync são baixados de novo na retomada.
+        with self.sync_lock:
+            with self.lock:
+                if self.dirty:
+                    # Os bytes fora de dirty já estão no manifesto, então o trecho todo pode ser regravado
+                    first, last = min(self.dirty), max(self.dirty)
+                    pending = bytes(self.bitmap[first:last + 1])
+                    self.dirty.clear()
+                else:
+                    pending = None
+            os.fsync(self.fd)
+            if pending is not None:
+                self._pwrite(self.manifest_fd, pending, self.bitmap_offset + first)
+                os.fsync(self.manifest_fd)
+
+    def _pwrite(self, fd, data, offset):
+        if hasattr(os, "pwrite"):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self.lock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.write(fd, data)
+
+    def _pread(self, size, offset):
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, size, offset)
+        with self.lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, size)
+
+
+def covered_chunks(bitmap, bitmap_chunk_size, file_size, chunk_size):
+    """Chunks de tamanho chunk_size inteiramente cobertos pelos chunks marcados num bitmap de outro tamanho de chunk"""
+    def has(i):
+        return i >> 3 < len(bitmap) and bitmap[i >> 3] & (1 << (i & 7))
+
+    total_chunks = (file_size + chunk_size - 1) // chunk_size
+    if bitmap_chunk_size == chunk_size:
+        return [chunk_index for chunk_index in range(total_chunks) if has(chunk_index)]
+    covered = []
+    for chunk_index in range(total_chunks):
+        start = chunk_index * chunk_size
+        end = min(start + chunk_size, file_size)
+        if all(has(i) for i in range(start // bitmap_chunk_size, (end - 1) // bitmap_chunk_size + 1)):
+            covered.append(chunk_index)
+    return covered
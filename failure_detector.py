@@ -0,0 +1,135 @@
+import logging
+import math
+import queue
+import threading
+import time
+from collections import deque
+
+
+HEARTBEAT_INTERVAL = 1.0   # Intervalo entre sondagens (PING) de cada vizinho [s]
+HEARTBEAT_TIMEOUT = 1.0    # Prazo da resposta a uma sondagem [s]
+HEARTBEAT_SAMPLES = 100    # Intervalos entre heartbeats guardados por vizinho
+HEARTBEAT_WORKERS = 16     # Sondagens simultâneas
+ACCEPTABLE_PAUSE = 1.0     # Atraso somado ao intervalo esperado antes de a suspeita começar a crescer [s]
+MIN_STD_DEVIATION = 0.2    # Desvio padrão mínimo dos intervalos, para a rede sem variação não gerar suspeitas [s]
+PHI_SUSPECT = 3.0          # Suspeita a partir da qual o vizinho fica SUSPECT (~1 chance em 1000 de estar ativo)
+PHI_OFFLINE = 8.0          # ... e OFFLINE
+
+logger = logging.getLogger(__name__)
+
+
+# Detector phi-accrual (Hayashibara et al.): em vez de um timeout fixo, mede a suspeita de o vizinho ter falhado
+# como phi = -log10(probabilidade de um heartbeat chegar tão atrasado), a partir da distribuição dos intervalos
+# observados. Vizinhos com atrasos irregulares precisam de mais tempo em silêncio para ficarem suspeitos.
+class PhiAccrualDetector:
+    def __init__(self, expected_interval, now=None):
+        self.last_heartbeat = time.monotonic() if now is None else now
+        # Começa como se já tivesse visto heartbeats no intervalo esperado
+        self.intervals = deque([expected_interval * 0.75, expected_interval * 1.25], maxlen=HEARTBEAT_SAMPLES)
+
+    def heartbeat(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.intervals.append(now - self.last_heartbeat)
+        self.last_heartbeat = now
+
+    def phi(self, now=None):
+        now = time.monotonic() if now is None else now
+        mean = sum(self.intervals) / len(self.intervals)
+        variance = sum((x - mean) ** 2 for x in self.intervals) / len(self.intervals)
+        std = max(MIN_STD_DEVIATION, math.sqrt(variance))
+        mean += ACCEPTABLE_PAUSE
+        # Probabilidade de o próximo heartbeat chegar depois de agora, supondo intervalos com distribuição normal
+        y = (now - self.last_heartbeat - mean) / std
+        p_later = 0.5 * math.erfc(y / math.sqrt(2))
+        return -math.log10(max(p_later, 1e-300))
+
+
+# Sonda periodicamente todos os vizinhos com PING e, a partir das respostas, mantém o status de cada um: ONLINE, SUSPECT ou OFFLINE conforme o phi do detector. Downloads e buscas evitam os que não estão ONLINE.
+class FailureDetector:
+    def __init__(self, peer, interval=HEARTBEAT_INTERVAL):
+        self.peer = peer
+        self.interval = interval
+        self.detectors = {}   # (ip, porta) -> PhiAccrualDetector
+        self.probing = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.pending_probes = queue.Queue()
+
+    def heartbeat(self, key):
+        with self.lock:
+            detector = self.detectors.get(key)
+            if detector is None:
+                detector = self.detectors[key] = PhiAccrualDetector(self.interval)
+            detector.heartbeat()
+
+    def forget(self, key):
+        """Descarta o histórico do vizinho (ex.: ele saiu com BYE); volta a ser acompanhado no próximo heartbeat"""
+        with self.lock:
+            self.detectors.pop(key, None)
+
+    def is_down(self, key):
+        """Se os heartbeats do vizinho pararam a ponto de ele ser considerado OFFLINE (sem histórico, não se sabe)"""
+        with self.lock:
+            detector = self.detectors.get(key)
+            return detector is not None and detector.phi() >= PHI_OFFLINE
+
+    def classify(self, key, current_status):
+        """Status do vizinho segundo o detector"""
+        with self.lock:
+            detector = self.detectors.get(key)
+            if detector is None:
+                # Sem heartbeats ainda: um vizinho OFFLINE continua assim; um dado como ativo passa a ser
+                # acompanhado a partir de agora e fica suspeito se não responder
+                if current_status == "OFFLINE":
+                    return current_status
+                detector = self.detectors[key] = PhiAccrualDetector(self.interval)
+            phi = detector.phi()
+        if phi >= PHI_OFFLINE:
+            return "OFFLINE"
+        if phi >= PHI_SUSPECT:
+            return "SUSPECT"
+        return "ONLINE"
+
+    def tick(self):
+        for neighbor in self.peer.neighbors:
+            key = neighbor.key
+            # Status a partir dos heartbeats até agora, antes da nova sondagem
+            current = neighbor.status
+            status = self.classify(key, current)
+            if status != current and self.peer.neighbors.set_status(key[0], key[1], status, current):
+                logger.info("Atualizando peer %s:%s status %s", key[0], key[1], status)
+            with self.lock:
+                if key in self.probing:
+                    continue
+                self.probing.add(key)
+            self.pending_probes.put(key)
+
+    def _probe(self, key):
+        try:
+            # O RTT medido pelo ping vai para a média do pool de conexões (ConnectionPool.rtt)
+            if self.peer.ping(key[0], key[1], HEARTBEAT_TIMEOUT) is not None:
+                self.heartbeat(key)
+        finally:
+            with self.lock:
+                self.probing.discard(key)
+
+    def start(self):
+        # Workers daemon, como os do servidor, para uma sondagem pendente não segurar o encerramento do programa
+        def probe_thread():
+            while True:
+                self._probe(self.pending_probes.get())
+
+        for _ in range(HEARTBEAT_WORKERS):
+            threading.Thread(target=probe_thread, daemon=True).start()
+
+        def heartbeat_thread():
+            while not self.stop_event.wait(self.interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.error("[Erro] Falha na verificação dos vizinhos: %s", e)
+
+        threading.Thread(target=heartbeat_thread, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
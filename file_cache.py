@@ -0,0 +1,113 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+
+MAX_OPEN_FILES = 64   # Arquivos compartilhados mantidos abertos pelo servidor (cada um ocupa um descritor)
+USE_MMAP = False      # Lê os chunks de um mapeamento do arquivo em memória em vez de pread. Desligado por padrão: um
+                      # arquivo truncado no lugar enquanto está mapeado (ex.: um cp por cima de um arquivo
+                      # compartilhado) derruba o processo (SIGBUS) ao ler o trecho que sumiu, e com pread a leitura
+                      # só volta mais curta. Só vale ligar se os arquivos compartilhados nunca são reescritos no lugar.
+
+
+# Arquivo compartilhado aberto para leitura, identificado por (dispositivo, inode, mtime, tamanho)
+class OpenFile:
+    def __init__(self, path, use_mmap=USE_MMAP):
+        self.file = open(path, "rb")
+        try:
+            stat = os.fstat(self.file.fileno())
+            self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.size = stat.st_size
+            # Arquivos vazios não podem ser mapeados
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap and self.size else None
+        except Exception:
+            self.file.close()
+            raise
+        self.users = 0          # Threads usando o arquivo; ele só é fechado quando todas o devolvem
+        self.retired = False    # Saiu do cache (substituído ou removido pelo LRU)
+        self.lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.identity[2:]
+
+    def read(self, offset, size):
+        if self.map is not None:
+            return self.map[offset:offset + size]
+        if hasattr(os, "pread"):
+            return os.pread(self.file.fileno(), size, offset)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+# Cache LRU dos arquivos compartilhados abertos, limitado a max_open descritores: cada DL custa um stat em vez de
+# open + seek + read + close. O stat também detecta arquivos substituídos ou alterados, que são reabertos.
+class FileHandleCache:
+    def __init__(self, max_open=MAX_OPEN_FILES, use_mmap=USE_MMAP):
+        self.max_open = max_open
+        self.use_mmap = use_mmap
+        self.entries = OrderedDict()  # caminho -> OpenFile
+        self.hits = 0
+        self.opens = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, path):
+        """Arquivo aberto e atualizado (OpenFile), ou None se ele não existe. Deve ser devolvido com release."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            handle = self.entries.get(path)
+            if handle is not None:
+                if handle.identity == identity:
+                    self.entries.move_to_end(path)
+                    handle.users += 1
+                    self.hits += 1
+                    return handle
+                self._retire(self.entries.pop(path))
+        # Abre fora do lock, para não atrasar os pedidos de arquivos que já estão abertos
+        try:
+            handle = OpenFile(path, self.use_mmap)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            self.opens += 1
+            previous = self.entries.pop(path, None)
+            if previous is not None:
+                self._retire(previous)
+            self.entries[path] = handle
+            handle.users += 1
+            while len(self.entries) > self.max_open:
+                self._retire(self.entries.popitem(last=False)[1])
+        return handle
+
+    def release(self, handle):
+        with self.lock:
+            handle.users -= 1
+            close = handle.retired and not handle.users
+        if close:
+            handle.close()
+
+    def close_all(self):
+        with self.lock:
+            while self.entries:
+                self._retire(self.entries.popitem()[1])
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "opens": self.opens, "open": len(self.entries)}
+
+    def _retire(self, handle):
+        # Chamado com o lock adquirido; quem ainda estiver usando o arquivo o fecha ao devolvê-lo
+        handle.retired = True
+        if not handle.users:
+            handle.close()
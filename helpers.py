@@ -1,4 +1,5 @@
 import os
+import socket
 
 # Função que lista os arquivos locais dado um certo diretório
 def list_local_files(directory: str) -> None:
@@ -26,3 +27,44 @@ def verify_files_path(directory: str) -> bool:
 # Função que formata uma string removendo quebras de linha
 def format_string(string: str) -> str:
     return string.replace("\n", "")
+
+# Função que representa índices de chunks de forma compacta, ex.: [0, 1, 2, 5, 7, 8] -> "0-2,5,7-8"
+def format_chunk_ranges(indices: list) -> str:
+    parts = []
+    start = previous = None
+    for index in sorted(indices):
+        if start is None:
+            start = previous = index
+        elif index == previous + 1:
+            previous = index
+        else:
+            parts.append(f"{start}-{previous}" if previous > start else str(start))
+            start = previous = index
+    if start is not None:
+        parts.append(f"{start}-{previous}" if previous > start else str(start))
+    return ",".join(parts)
+
+# Função que faz o inverso de format_chunk_ranges, parando em limit índices
+def parse_chunk_ranges(spec: str, limit: int) -> list:
+    indices = []
+    for part in spec.split(","):
+        remaining = limit - len(indices)
+        if remaining <= 0:
+            break
+        if "-" in part:
+            start, end = part.split("-")
+            indices.extend(range(int(start), min(int(end) + 1, int(start) + remaining)))
+        elif part:
+            indices.append(int(part))
+    return indices
+
+# Função que escolhe portas livres pelo sistema (bind na porta 0): portas fixas podem estar em TIME_WAIT de uma
+# execução anterior ou ocupadas por conexões de saída
+def free_ports(count: int) -> list:
+    sockets = [socket.socket() for _ in range(count)]
+    for sock in sockets:
+        sock.bind(("127.0.0.1", 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
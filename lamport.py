@@ -0,0 +1,55 @@
+import itertools
+import threading
+
+
+MERGE_STEP_LIMIT = 1024  # Maior avanço feito consumindo o contador; saltos maiores trocam o contador
+
+
+# Relógio de Lamport compartilhado pela thread do servidor, pelos workers de download e pelas threads de gossip,
+# DHT e heartbeat. Os valores saem de um itertools.count: cada next() é uma única operação em C, atômica sob o GIL,
+# então tick() não pega lock e dois eventos nunca recebem o mesmo valor. merge() também não pega lock quando o
+# relógio local já está à frente do clock recebido, o caso comum; só quando está atrás ele avança o contador sob
+# o lock, consumindo os valores até o recebido ou, num salto grande, trocando o contador por um que começa depois.
+class LamportClock:
+    def __init__(self, start=0):
+        self.counter = itertools.count(start + 1)
+        self.last = start  # Último valor emitido, só para exibição (pode ficar um pouco atrás sob concorrência)
+        self.lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self.last
+
+    def tick(self):
+        """Evento local (ex.: envio de uma mensagem): retorna o novo valor do relógio"""
+        value = next(self.counter)
+        if value > self.last:
+            self.last = value
+        return value
+
+    def merge(self, received):
+        """Recebimento de uma mensagem com clock received: retorna um valor maior que ele e que o relógio local"""
+        value = next(self.counter)
+        if value <= received:
+            value = self._advance(received)
+        if value > self.last:
+            self.last = value
+        return value
+
+    def _advance(self, received):
+        with self.lock:
+            value = next(self.counter)
+            gap = received - value
+            if gap < 0:
+                # Outra thread já avançou o relógio
+                return value
+            if gap < MERGE_STEP_LIMIT:
+                # Descarta os valores até received numa única chamada em C e retorna o seguinte
+                return next(itertools.islice(self.counter, gap, None))
+            # Threads no meio de um tick ainda podem tirar um valor do contador antigo, que está mais de
+            # MERGE_STEP_LIMIT atrás de received: os valores dos dois contadores não se encontram
+            self.counter = itertools.count(received + 2)
+            return received + 1
+
+    def __repr__(self):
+        return f"LamportClock({self.last})"
@@ -0,0 +1,71 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+
+
+LOG_LEVEL = logging.INFO     # Nível padrão: mensagens de controle e eventos; o trace de cada mensagem fica em DEBUG
+LOG_QUEUE_SIZE = 10000       # Registros esperando a escrita; com a fila cheia os excedentes são descartados
+MAX_LOGGED_MESSAGE = 200     # Caracteres de uma mensagem do protocolo mostrados no log (o FILE traz o chunk em base64)
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+
+# Mensagem do protocolo passada como argumento do log: só é formatada (sem a quebra de linha e cortada em
+# MAX_LOGGED_MESSAGE caracteres) se o registro for de fato escrito, e então pela thread de escrita
+class Truncated:
+    __slots__ = ("message",)
+
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        text = self.message.replace("\n", "")
+        if len(text) > MAX_LOGGED_MESSAGE:
+            return f"{text[:MAX_LOGGED_MESSAGE]}... (+{len(text) - MAX_LOGGED_MESSAGE} caracteres)"
+        return text
+
+
+# Entrega os registros à thread de escrita sem formatá-los nem bloquear quem registrou. Os argumentos dos logs
+# deste projeto são imutáveis (strings, números, Truncated), então podem ser formatados depois, em outra thread.
+class BackgroundHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    """Envia os logs de todos os módulos para stream (a saída padrão), escritos por uma thread em segundo plano"""
+    global _listener
+    if isinstance(level, str):
+        level = LEVELS[level.lower()]
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(stream or sys.stdout)
+    # Mesmo formato dos prints que os logs substituem
+    output.setFormatter(logging.Formatter("%(message)s"))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root.addHandler(BackgroundHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    # Escreve o que ainda estiver na fila ao sair
+    atexit.register(_listener.stop)
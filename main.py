@@ -1,13 +1,27 @@
 import sys
+import logging
 import socket
 import helpers
-import os
-from peer import Peer
+import protocol
+from peer import Peer, MAX_RANGE_CHUNKS
+from async_peer import AsyncPeer
+from scheduler import ChunkScheduler, MAX_WINDOW, HEDGE_CHECK_INTERVAL
+from tuning import AUTO_CHUNK_SIZE, choose_chunk_size, next_batch_size
+from collections import deque
 import time
 import statistics
 import csv
-import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait
+from log import LEVELS, LOG_LEVEL, setup_logging
+
+
+RANGE_BATCH = 32             # Chunks pedidos no primeiro DL_RANGE; os seguintes são ajustados pela vazão medida
+PIPELINE_DEPTH = 2           # Lotes DL_RANGE pedidos na mesma conexão antes de ler as respostas
+HAVE_REFRESH_INTERVAL = 2.0  # Intervalo entre consultas dos chunks que os peers com o arquivo incompleto já têm [s]
+RANGE_PROBES = 2             # Conexões novas fechadas sem resposta ao DL_RANGE até o peer passar a receber DL
+RANGE_PROBE_DELAY = 0.5      # Espera antes de tentar o DL_RANGE de novo numa conexão nova [s]
+
+logger = logging.getLogger(__name__)
 
 
 # Mostra o menu no terminal
@@ -23,44 +37,207 @@ def print_menu():
     print("\t[9] Sair")
 
 
-def download_chunk(main_peer, file_name, chunk_size, chunk_index, peer_ip, peer_port):
-    """Baixa um chunk específico de um peer."""
+def query_neighbors(main_peer, verb, neighbors):
+    """Consulta os vizinhos em paralelo, mostrando cada resposta assim que chega, e retorna os que responderam"""
+    if not neighbors:
+        print("Nenhum peer disponível.")
+        return []
+    answered = []
+    # O que já era conhecido antes da consulta: de cada resposta só aparece o que ela acrescentou
+    known_files = main_peer.catalog.keys()
+    known_neighbors = len(main_peer.neighbors)
+    for neighbor, success, elapsed in main_peer.query_neighbors(verb, neighbors):
+        if success:
+            answered.append(neighbor)
+        status = "respondeu" if success else "falhou"
+        print(f"[{len(answered)}/{len(neighbors)}] {neighbor.ip}:{neighbor.port} {status} em {elapsed * 1000:.0f} ms")
+        if not success:
+            continue
+        if verb == "LS":
+            for entry in main_peer.catalog.peer_files(neighbor.key):
+                if (entry.name, entry.size) not in known_files:
+                    known_files.add((entry.name, entry.size))
+                    partial = " (parcial)" if neighbor.key in entry.partial else ""
+                    print(f"    + {entry.name} | {entry.size} bytes{partial}")
+        elif verb == "GET_PEERS":
+            # A tabela só cresce no fim: os vizinhos novos são os que vêm depois dos já conhecidos
+            added = main_peer.neighbors.snapshot[known_neighbors:]
+            known_neighbors += len(added)
+            for new_neighbor in added:
+                print(f"    + {new_neighbor.ip}:{new_neighbor.port} {new_neighbor.status}")
+    missing = [f"{n.ip}:{n.port}" for n in neighbors if n not in answered]
+    if missing:
+        print(f"Sem resposta de {len(missing)} peer(s): {', '.join(missing)}")
+    return answered
+
+
+def download_chunk(main_peer, file_name, chunk_size, chunk_index, peer_ip, peer_port, timeout=None):
+    """Baixa um chunk específico de um peer, esperando a resposta até timeout segundos."""
     try:
-        main_peer.increment_clock()
-        message = f"{main_peer.ip}:{main_peer.port} {main_peer.clock} DL {file_name} {chunk_size} {chunk_index}\n"
-        return main_peer.send_command(message, peer_ip, peer_port, expect_response=True)
+        clock = main_peer.increment_clock()
+        message = protocol.format_message(main_peer.ip, main_peer.port, clock, "DL", file_name, chunk_size,
+                                          chunk_index, *main_peer.transfer_options())
+        success = main_peer.send_command(message, peer_ip, peer_port, expect_response=True, timeout=timeout)
+        return success and main_peer.has_chunk(file_name, chunk_index)
     except Exception as e:
-        print(f"Erro ao baixar chunk {chunk_index}: {e}")
+        logger.error("Erro ao baixar chunk %s: %s", chunk_index, e)
         return False
 
 
+def download_range_worker(main_peer, scheduler, file_name, file_size, chunk_size, peer):
+    """Baixa lotes de chunks de um peer com DL_RANGE, pedindo o próximo lote antes de o atual terminar.
+    Retorna True ao terminar, False se o peer fechou uma conexão nova sem responder (pode não entender DL_RANGE)
+    e None após um erro na conexão."""
+    batches = deque()
+    batch_size = RANGE_BATCH
+    answered = False
+    conn = None
+    try:
+        conn = main_peer.pool.acquire(peer[0], peer[1])
+        while True:
+            # Mantém até PIPELINE_DEPTH lotes pedidos; só espera por chunks quando não há nenhum pendente. O servidor
+            # atende os lotes em ordem, então só o da frente tem o relógio correndo: os de trás não são dados como
+            # atrasados (e pedidos em duplicata) enquanto esperam a vez.
+            while len(batches) < PIPELINE_DEPTH:
+                batch = scheduler.next_batch(peer, batch_size, block=not batches, start=not batches)
+                if not batch:
+                    break
+                # Registrado antes do envio: se ele falhar, os chunks do lote também são devolvidos ao escalonador
+                batches.append((batch, time.monotonic()))
+                main_peer.send_range_request(conn, file_name, chunk_size, batch)
+            if not batches:
+                break
+
+            batch, started = batches[0]
+            conn.sock.settimeout(scheduler.request_timeout())
+            main_peer.receive_range_response(conn)
+            answered = True
+            batches.popleft()
+            if batches:
+                scheduler.start(peer, batches[0][0])
+                batches[0] = (batches[0][0], time.monotonic())
+            elapsed = time.monotonic() - started
+            received = 0
+            missing = []
+            for chunk_index in batch:
+                if main_peer.has_chunk(file_name, chunk_index):
+                    size = min(chunk_size, file_size - chunk_index * chunk_size)
+                    # O lote entra uma vez nas latências: todos os seus chunks têm a mesma duração
+                    scheduler.complete(peer, chunk_index, size, elapsed, sample=not received)
+                    received += size
+                else:
+                    missing.append(chunk_index)
+            if missing:
+                logger.warning("Falha ao baixar %s chunks de %s:%s", len(missing), peer[0], peer[1])
+                scheduler.fail_batch(peer, missing)
+            # Lotes maiores conforme a vazão do peer cresce, menores se ela cai
+            batch_size = next_batch_size(received / max(elapsed, 1e-6), chunk_size, MAX_RANGE_CHUNKS) or batch_size
+        main_peer.pool.release(conn)
+        return True
+
+    except Exception as e:
+        if conn is not None:
+            main_peer.pool.discard(conn)
+        # Peers antigos fecham a conexão sem responder ao verbo que não conhecem: os chunks voltam sem contar falha
+        if conn is not None and not conn.reused and not answered and isinstance(e, ConnectionError):
+            for batch, _ in batches:
+                for chunk_index in batch:
+                    scheduler.requeue(peer, chunk_index)
+            return False
+
+        # Os chunks dos lotes sem resposta são repassados a outros peers; o erro conta como uma falha do peer
+        if batches:
+            scheduler.fail_batch(peer, [chunk_index for batch, _ in batches for chunk_index in batch])
+        else:
+            scheduler.peer_error(peer)
+        logger.error("Erro no download de %s:%s: %s", peer[0], peer[1], e)
+        return None
+
+
 def download_file_parallel(main_peer, file_info, chunk_size):
-    """Faz o download paralelo dos chunks de todos os peers disponíveis."""
+    """Faz o download paralelo dos chunks de todos os peers disponíveis, com roubo de trabalho entre eles."""
     file_name = file_info["name"]
     file_size = int(file_info["size"])
-    peers = [p.strip() for p in file_info["peer"].split(",") if p.strip()]
-    peer_list = [(p.split(":")[0], int(p.split(":")[1])) for p in peers]
+    # Peers que o detector de falhas dá como fora do ar ficam de fora, para não esperar pelo timeout da conexão
+    peer_list = main_peer.live_peers(list(file_info["peers"]))
+    # Peers que ainda estão baixando o arquivo servem os chunks que já têm
+    partial_peers = [peer for peer in peer_list if peer in file_info.get("partial", ())]
     total_chunks = (file_size + chunk_size - 1) // chunk_size
+    # Só os chunks que ainda faltam: num download retomado, parte deles já está no disco
+    missing = main_peer.missing_chunks(file_name)
+
+    # Com peers de arquivo incompleto, cada um só recebe os chunks que tem e os mais raros são pedidos primeiro
+    availability = None
+    if partial_peers:
+        availability = main_peer.chunk_availability(file_name, file_size, chunk_size, partial_peers)
+
+    # O peer assíncrono faz o download no próprio event loop
+    if isinstance(main_peer, AsyncPeer):
+        return main_peer.download_file(file_name, file_size, chunk_size, peer_list, availability,
+                                       HAVE_REFRESH_INTERVAL)
+
+    # Com DL_RANGE, cada peer recebe lotes numa conexão com pedidos enfileirados; a janela cobre os lotes pendentes
+    use_ranges = main_peer.range_requests
+    if use_ranges:
+        window = MAX_RANGE_CHUNKS * PIPELINE_DEPTH
+        scheduler = ChunkScheduler(total_chunks, peer_list, chunk_size, max_window=window, initial_window=window,
+                                   adaptive=False, response_timeout=main_peer.pool.response_timeout,
+                                   chunks=missing, availability=availability)
+    else:
+        # Cada peer tem até MAX_WINDOW workers; quantos ficam ativos é decidido pela janela do escalonador
+        scheduler = ChunkScheduler(total_chunks, peer_list, chunk_size, response_timeout=main_peer.pool.response_timeout,
+                                   chunks=missing, availability=availability)
+
+    def chunk_worker(peer):
+        while True:
+            chunk_index = scheduler.next_chunk(peer)
+            if chunk_index is None:
+                return
+            started = time.monotonic()
+            timeout = scheduler.request_timeout()
+            if download_chunk(main_peer, file_name, chunk_size, chunk_index, peer[0], peer[1], timeout):
+                size = min(chunk_size, file_size - chunk_index * chunk_size)
+                scheduler.complete(peer, chunk_index, size, time.monotonic() - started)
+            else:
+                logger.warning("Falha ao baixar chunk %s de %s:%s", chunk_index, peer[0], peer[1])
+                scheduler.fail(peer, chunk_index)
+
+    def worker(peer):
+        if use_ranges and main_peer.range_supported(peer):
+            # Após um erro, abre outra conexão enquanto o peer continuar no download. Peers atuais também fecham uma
+            # conexão nova sem responder (fila cheia, reinício): só depois de RANGE_PROBES vezes seguidas o peer é
+            # dado como antigo e passa a receber DL chunk a chunk
+            refusals = 0
+            while True:
+                result = download_range_worker(main_peer, scheduler, file_name, file_size, chunk_size, peer)
+                if result is False:
+                    refusals += 1
+                    if refusals >= RANGE_PROBES:
+                        main_peer.mark_range_unsupported(peer)
+                        logger.info("%s:%s não aceita DL_RANGE, usando DL", peer[0], peer[1])
+                        break
+                    time.sleep(RANGE_PROBE_DELAY)
+                    continue
+                if result or not scheduler.is_active(peer):
+                    return
+                refusals = 0
+        chunk_worker(peer)
 
     start_time = time.time()
-    with ThreadPoolExecutor(max_workers=len(peer_list)) as executor:
-        futures = []
-        for chunk_index in range(total_chunks):
-            peer_ip, peer_port = peer_list[chunk_index % len(peer_list)]
-            futures.append(
-                executor.submit(
-                    download_chunk, main_peer, file_name, chunk_size, chunk_index, peer_ip, peer_port
-                )
-            )
-        # Aguarda todos os downloads terminarem
-        for i, future in enumerate(futures):
-            try:
-                success = future.result(timeout=10)
-                if not success:
-                    print(f"Falha ao baixar chunk {i}")
-            except Exception as e:
-                print(f"Erro no chunk {i}: {e}")
-
+    workers_per_peer = 1 if use_ranges else MAX_WINDOW
+    executor = ThreadPoolExecutor(max_workers=len(peer_list) * workers_per_peer)
+    futures = [executor.submit(worker, peer) for peer in peer_list for _ in range(workers_per_peer)]
+    # Quando todos os chunks chegaram não espera os pedidos em duplicata perdedores, que são descartados ao chegar
+    next_refresh = time.monotonic() + HAVE_REFRESH_INTERVAL
+    while wait(futures, timeout=HEDGE_CHECK_INTERVAL).not_done and not scheduler.finished():
+        # Os peers com o arquivo incompleto continuam baixando: os chunks novos passam a poder ser pedidos a eles
+        if availability is not None and time.monotonic() >= next_refresh:
+            for peer, chunks in main_peer.chunk_availability(file_name, file_size, chunk_size, partial_peers).items():
+                scheduler.add_available(peer, chunks)
+            next_refresh = time.monotonic() + HAVE_REFRESH_INTERVAL
+    executor.shutdown(wait=False)
+
+    main_peer.report_scheduler(scheduler)
     duration = time.time() - start_time
     return duration
 
@@ -70,7 +247,19 @@ def main(args: list):
     params = args
     peer_ip_and_port = params[0]
     shared_directory = params[2]
-    chunck_size = 256
+    # Por padrão o tamanho de chunk é escolhido a cada download (opção 6 fixa um valor)
+    chunck_size = AUTO_CHUNK_SIZE
+    # "--async" seleciona o peer baseado em asyncio no lugar do baseado em threads
+    peer_class = AsyncPeer if "--async" in params[3:] else Peer
+    # "--log=debug" mostra cada mensagem recebida e cada atualização do relógio; o padrão (info) só as de controle
+    log_level = LOG_LEVEL
+    for param in params[3:]:
+        if param.startswith("--log="):
+            log_level = param.split("=", 1)[1].lower()
+            if log_level not in LEVELS:
+                print(f"Nível de log inválido: {log_level} (use {', '.join(LEVELS)})")
+                exit(0)
+    setup_logging(log_level)
 
     # Verifica se o diretório é válido
     if not helpers.verify_files_path(shared_directory):
@@ -80,8 +269,23 @@ def main(args: list):
     PEER_PORT = peer_ip_and_port.split(":")[1]
 
     # Cria o peer principal
-    main_peer = Peer.create_peer(
-        ip=PEER_IP, port=PEER_PORT, shared_directory=shared_directory, status="ONLINE", neighbors_file=params[1], chunck_size=256)
+    main_peer = peer_class.create_peer(
+        ip=PEER_IP, port=PEER_PORT, shared_directory=shared_directory, status="ONLINE", neighbors_file=params[1], chunck_size=chunck_size)
+    # "--text" força a transferência de chunks em base64 (FILE), como nas versões antigas
+    if "--text" in params[3:]:
+        main_peer.binary_transfer = False
+    # "--no-compression" pede os chunks sem compressão
+    if "--no-compression" in params[3:]:
+        main_peer.compressed_transfer = False
+    # A tabela de vizinhos é sincronizada em segundo plano por gossip, a menos que "--no-gossip" seja passado
+    if "--no-gossip" not in params[3:]:
+        main_peer.start_gossip()
+    # Os arquivos compartilhados são publicados na DHT, a menos que "--no-dht" seja passado
+    if "--no-dht" not in params[3:]:
+        main_peer.dht.start()
+    # Os vizinhos são sondados periodicamente e marcados SUSPECT/OFFLINE, a menos que "--no-heartbeat" seja passado
+    if "--no-heartbeat" not in params[3:]:
+        main_peer.detector.start()
 
     while True:
         send_message = False
@@ -98,7 +302,7 @@ def main(args: list):
             print("[0] Voltar para o menu anterior")
             for index, neighbor in enumerate(main_peer.neighbors, start=1):
                 print(
-                    f"[{index}] {neighbor['ip']}:{neighbor['port']} {neighbor['status']} (clock: {neighbor['clock']})")
+                    f"[{index}] {neighbor.ip}:{neighbor.port} {neighbor.status} (clock: {neighbor.clock})")
             sub_choice = input(">").strip()
             if sub_choice == "0":
                 continue
@@ -106,15 +310,14 @@ def main(args: list):
                 sub_choice_int = int(sub_choice)
                 if 1 <= sub_choice_int <= len(main_peer.neighbors):
                     peer = main_peer.neighbors[sub_choice_int - 1]
-                    main_peer.increment_clock()
-                    message = f"{main_peer.ip}:{main_peer.port} {main_peer.clock} HELLO\n"
-                    print(
-                        f"Encaminhando mensagem '{message.strip()}' para {peer['ip']}:{peer['port']}")
+                    clock = main_peer.increment_clock()
+                    message = protocol.format_message(main_peer.ip, main_peer.port, clock, "HELLO")
+                    logger.info("Encaminhando mensagem '%s' para %s:%s", message.strip(), peer.ip, peer.port)
                     send_message = main_peer.send_command(
-                        message, peer["ip"], int(peer["port"]))
+                        message, peer.ip, peer.port)
                     if send_message:
                         main_peer.change_neighbor_status(
-                            peer["ip"], peer["port"], "ONLINE", peer['clock'])
+                            peer.ip, peer.port, "ONLINE", peer.clock)
                 else:
                     print("Opção inválida.")
             except ValueError:
@@ -170,14 +373,9 @@ def main(args: list):
                 continue
 
         elif choice == "2":
-            original_neighbors = main_peer.neighbors.copy()
-            for neighbor in original_neighbors:
-                main_peer.increment_clock()
-                message = f"{main_peer.ip}:{main_peer.port} {main_peer.clock} GET_PEERS\n"
-                print(
-                    f"Encaminhando mensagem '{message.strip()}' para {neighbor['ip']}:{neighbor['port']}")
-                main_peer.send_command(message, neighbor["ip"], int(
-                    neighbor["port"]), expect_response=True)
+            # Pergunta a todos os vizinhos ao mesmo tempo; os novos peers aparecem conforme as respostas chegam
+            original_neighbors = main_peer.neighbors.snapshot
+            query_neighbors(main_peer, "GET_PEERS", original_neighbors)
 
         # Verifica se o usuário escolheu a opção de listar os arquivos locais
         elif choice == "3":
@@ -187,39 +385,34 @@ def main(args: list):
 
         # Verifica se o usuário escolheu a opção de buscar arquivos
         elif choice == "4":
-            # Envia a solicitação para todos os pares online
-            for neighbor in main_peer.neighbors:
-                if neighbor["status"] == "ONLINE":
-                    main_peer.increment_clock()
-                    message = f"{main_peer.ip}:{main_peer.port} {main_peer.clock} LS\n"
-                    print(
-                        f"Encaminhando mensagem '{message.strip()}' para {neighbor['ip']}:{neighbor['port']}")
-                    main_peer.send_command(message, neighbor["ip"], int(
-                        neighbor["port"]), expect_response=True)
-
-            # Agrupa arquivos iguais (mesmo nome e tamanho)
-            grouped_files = {}
-            for file in main_peer.received_files:
-                key = (file["name"], file["size"])
-                if key not in grouped_files:
-                    grouped_files[key] = {"peers": set()}
-                # Adiciona acada peer ao conjunto de peers
-                for peer in file["peer"].split(','):
-                    peer = peer.strip()
-                    if peer:  # Only add non-empty peers
-                        grouped_files[key]["peers"].add(peer)
-
-            if not grouped_files:
+            print("Digite o nome do arquivo, ou parte dele (vazio para listar todos):")
+            query = input("> ").strip()
+
+            # Um nome completo é procurado primeiro na DHT, sem consultar todos os vizinhos
+            located = main_peer.dht.locate(query) if query else []
+            for name, size, holder in located:
+                main_peer.catalog.add(name, size, holder)
+            if located:
+                print(f"{len(located)} fonte(s) encontradas na DHT")
+            else:
+                # Envia a solicitação para todos os pares online ao mesmo tempo, com um prazo total
+                online_neighbors = [n for n in main_peer.neighbors if n.status == "ONLINE"]
+                query_neighbors(main_peer, "LS", online_neighbors)
+                print(f"{len(main_peer.catalog)} arquivo(s) conhecidos na rede")
+
+            # O catálogo já agrupa os arquivos iguais (mesmo nome e tamanho); filtra pelo trecho do nome digitado
+            found_files = main_peer.catalog.search(query)
+
+            if not found_files:
                 print("Nenhum arquivo encontrado.")
             else:
                 print("\nArquivos encontrados na rede:")
                 print(f"{'Index':<8}{'Nome':<26} | {'Tamanho':<10} | {'Peers':<20}")
                 print(f"[0] {'<Cancelar>':<30}")
-                for index, (key, value) in enumerate(grouped_files.items(), start=1):
-                    name, size = key
-
-                    peers = ", ".join(sorted(value["peers"]))
-                    print(f"[{index}] {name:<30} | {size:<10} | {peers:<25}")
+                for index, entry in enumerate(found_files, start=1):
+                    peers = ", ".join(f"{ip}:{port}" + (" (parcial)" if (ip, port) in entry.partial else "")
+                                      for ip, port in entry.live_peers())
+                    print(f"[{index}] {entry.name:<30} | {entry.size:<10} | {peers:<25}")
 
                 print("\nDigite o número do arquivo para fazer o download:")
                 file_choice = input("> ").strip()
@@ -230,66 +423,67 @@ def main(args: list):
                     file_choice_int = int(file_choice)
                     
                     # Move a validação do índice para antes de qualquer processamento
-                    if not (1 <= file_choice_int <= len(grouped_files)):
+                    if not (1 <= file_choice_int <= len(found_files)):
                         print("Opção inválida.")
                         continue
 
                     # Se chegou aqui, o índice é válido
-                    selected_key = list(grouped_files.keys())[file_choice_int - 1]
-                    selected_file_name, selected_file_size = selected_key
-                    selected_peers = grouped_files[selected_key]["peers"]
+                    selected_entry = found_files[file_choice_int - 1]
+                    selected_file_name = selected_entry.name
+                    selected_file_size = selected_entry.size
+                    selected_peers = selected_entry.live_peers()
 
                     print(f"Arquivo selecionado: {selected_file_name}")
-                    
-                    # Calcula o número total de chunks
-                    total_chunks = (int(selected_file_size) + main_peer.chunck_size - 1) // main_peer.chunck_size
-                    
+
+                    # Usa o tamanho de chunk fixado pela opção 6 ou escolhe um a partir do arquivo e das medições recentes
+                    chunk_size = main_peer.chunck_size
+                    if chunk_size == AUTO_CHUNK_SIZE:
+                        chunk_size = choose_chunk_size(
+                            int(selected_file_size),
+                            len(selected_peers),
+                            main_peer.neighbors_rtt(selected_peers),
+                            main_peer.recent_throughput()
+                        )
+                        print(f"Tamanho de chunk escolhido automaticamente: {chunk_size}")
+
                     try:
-                        # Primeiro cria um arquivo vazio no diretório compartilhado
-                        file_path = os.path.join(shared_directory, selected_file_name)
-                        with open(file_path, "wb") as f:
-                            pass
-                            
-                        # Prepara a lista de peers disponíveis
-                        try:
-                            available_peers = []
-                            for peer in selected_peers:
-                                for p in peer.split(','):
-                                    p = p.strip()
-                                    if p:
-                                        ip, port = p.split(':')
-                                        available_peers.append(f"{ip}:{port}")
+                        # Primeiro cria o arquivo de destino (pré-alocado) no diretório compartilhado
+                        sink = main_peer.start_download(selected_file_name, int(selected_file_size), chunk_size)
+                        if sink.resumed:
+                            chunk_size = sink.chunk_size
+                            print(f"Retomando download: {sink.resumed} de {sink.total_chunks} chunks já baixados "
+                                  f"(chunk de {chunk_size} bytes)")
 
+                        try:
                             # Monta o dicionário file_info
                             file_info = {
                                 "name": selected_file_name,
                                 "size": selected_file_size,
-                                "peer": ",".join(available_peers)
+                                "peers": selected_peers,
+                                "partial": set(selected_entry.partial)
                             }
 
-                            duration = download_file_parallel(main_peer, file_info, main_peer.chunck_size)
+                            try:
+                                duration = download_file_parallel(main_peer, file_info, chunk_size)
+                            finally:
+                                # Os chunks já foram escritos conforme chegaram: só falta o fsync e renomear o arquivo
+                                sink = main_peer.finish_download(selected_file_name)
 
-                            # Salva o arquivo
-                            file_path = os.path.join(shared_directory, selected_file_name)
-                            total_chunks = (int(selected_file_size) + main_peer.chunck_size - 1) // main_peer.chunck_size
-                            with open(file_path, "wb") as f:
-                                for chunk_index in range(total_chunks):
-                                    chunk_data = main_peer.get_chunk_data(selected_file_name, chunk_index)
-                                    if chunk_data:
-                                        f.write(chunk_data)
-                                    else:
-                                        print(f"Chunk {chunk_index} ausente!")
+                            for chunk_index in sink.missing_chunks():
+                                print(f"Chunk {chunk_index} ausente!")
+                            if not sink.is_complete():
+                                print(f"Download incompleto, arquivo parcial mantido em {sink.path}. "
+                                      "Buscar o arquivo de novo retoma o download.")
 
                             # Estatísticas
                             main_peer.add_download_stat(
                                 selected_file_name,
                                 int(selected_file_size),
-                                main_peer.chunck_size,
-                                len(available_peers),
+                                chunk_size,
+                                len(selected_peers),
                                 duration
                             )
                             print(f"Download do arquivo {selected_file_name} finalizado em {duration:.2f}s")
-                            main_peer.received_chunks = {}
                         
                         except Exception as e:
                             print(f"Erro ao baixar o arquivo: {str(e)}")
@@ -308,10 +502,13 @@ def main(args: list):
         # Verifica se o usuário escolheu a opção de alterar o tamanho do chunk
         elif choice == "6":
             try:
-                print("Digite novo tamanho de chunk:")
+                print(f"Digite novo tamanho de chunk ({AUTO_CHUNK_SIZE} para escolha automática):")
                 new_chunk_size = int(input("> ").strip())
-                if new_chunk_size <= 0:
+                if new_chunk_size < 0:
                     print("Tamanho do chunk deve ser um número positivo.")
+                elif new_chunk_size == AUTO_CHUNK_SIZE:
+                    main_peer.chunck_size = new_chunk_size
+                    print("Tamanho de chunk alterado: automático")
                 else:
                     main_peer.chunck_size = new_chunk_size
                     print(f"Tamanho de chunk alterado: {new_chunk_size}")
@@ -322,13 +519,16 @@ def main(args: list):
         # Verifica se o usuário escolheu a opção de sair. Em seguida, encaminha a mensagem BYE para todos os vizinhos
         elif choice == "9":
             print("Saindo...")
+            # Sem novas rodadas de gossip anunciando o peer como ativo depois do BYE
+            main_peer.stop_gossip()
+            main_peer.dht.stop()
+            main_peer.detector.stop()
             for neighbor in main_peer.neighbors:
-                main_peer.increment_clock()
-                message = f"{main_peer.ip}:{main_peer.port} {main_peer.clock} BYE\n"
-                print(
-                    f"Encaminhando mensagem '{message.strip()}' para {neighbor['ip']}:{neighbor['port']}")
+                clock = main_peer.increment_clock()
+                message = protocol.format_message(main_peer.ip, main_peer.port, clock, "BYE")
+                logger.info("Encaminhando mensagem '%s' para %s:%s", message.strip(), neighbor.ip, neighbor.port)
                 main_peer.send_command(
-                    message, neighbor["ip"], int(neighbor["port"]))
+                    message, neighbor.ip, neighbor.port)
             exit(0)
         else:
             print("Opção inválida. Tente novamente.")
@@ -0,0 +1,102 @@
+import threading
+
+
+# Vizinho conhecido: endereço, status (ONLINE, SUSPECT ou OFFLINE) e o último clock de Lamport visto dele
+class Neighbor:
+    __slots__ = ("ip", "port", "status", "clock")
+
+    def __init__(self, ip, port, status, clock):
+        self.ip = ip
+        self.port = int(port)
+        self.status = status
+        self.clock = int(clock)
+
+    @property
+    def key(self):
+        return (self.ip, self.port)
+
+    def __repr__(self):
+        return f"Neighbor({self.ip}:{self.port} {self.status} clock={self.clock})"
+
+
+# Tabela de vizinhos indexada por (ip, porta), com a porta sempre inteira. As leituras não pegam lock: a iteração
+# usa uma tupla imutável que só é substituída (cópia na escrita) quando um vizinho entra, e a consulta por chave é
+# um acesso a dicionário. Atualizações de status e clock são feitas com o lock, no próprio registro.
+class NeighborTable:
+    def __init__(self, neighbors=()):
+        self.by_key = {neighbor.key: neighbor for neighbor in neighbors}
+        self.snapshot = tuple(self.by_key.values())
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(self.snapshot)
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __getitem__(self, index):
+        return self.snapshot[index]
+
+    def get(self, ip, port):
+        return self.by_key.get((ip, int(port)))
+
+    def add(self, ip, port, status, clock):
+        """Adiciona o vizinho se ele ainda não existe; retorna o novo registro ou None"""
+        with self.lock:
+            if (ip, int(port)) in self.by_key:
+                return None
+            return self._insert(Neighbor(ip, port, status, clock))
+
+    def update_status(self, ip, port, status, clock):
+        """Atualiza (ou adiciona) o vizinho; um OFFLINE com clock menor que o conhecido é ignorado.
+        Retorna "added", "updated" ou None."""
+        clock = int(clock)
+        with self.lock:
+            neighbor = self.by_key.get((ip, int(port)))
+            if neighbor is None:
+                self._insert(Neighbor(ip, port, status, clock))
+                return "added"
+            if status == "OFFLINE" and clock < neighbor.clock:
+                return None
+            neighbor.status = status
+            neighbor.clock = clock
+            return "updated"
+
+    def merge(self, ip, port, status, clock, direct=False):
+        """Incorpora uma entrada recebida por gossip: vale a de maior clock (ou igual, com direct).
+        Retorna "added", "changed" (o status mudou), "updated" ou None."""
+        clock = int(clock)
+        with self.lock:
+            neighbor = self.by_key.get((ip, int(port)))
+            if neighbor is None:
+                self._insert(Neighbor(ip, port, status, clock))
+                return "added"
+            if clock > neighbor.clock or (direct and clock == neighbor.clock):
+                changed = neighbor.status != status
+                neighbor.status = status
+                neighbor.clock = clock
+                return "changed" if changed else "updated"
+            return None
+
+    def set_status(self, ip, port, status, expected):
+        """Troca o status do vizinho se ele ainda for expected: uma atualização feita nesse meio-tempo (ex.: um
+        HELLO) vale sobre a decisão tomada com o status anterior. Retorna se o status foi trocado."""
+        with self.lock:
+            neighbor = self.by_key.get((ip, int(port)))
+            if neighbor is None or neighbor.status != expected:
+                return False
+            neighbor.status = status
+            return True
+
+    def observe_clock(self, ip, port, clock):
+        """Registra o clock de uma mensagem recebida do vizinho, se for maior que o conhecido"""
+        neighbor = self.by_key.get((ip, int(port)))
+        if neighbor is not None and neighbor.clock < clock:
+            with self.lock:
+                neighbor.clock = max(neighbor.clock, clock)
+
+    def _insert(self, neighbor):
+        # Chamado com o lock adquirido: publica uma nova tupla para os leitores
+        self.by_key[neighbor.key] = neighbor
+        self.snapshot = self.snapshot + (neighbor,)
+        return neighbor
@@ -1,38 +1,106 @@
 import socket
+import selectors
+import logging
 import helpers
+import protocol
+import compression
 import threading
 import os
 import base64
+import errno
 import statistics
-from collections import defaultdict
+from collections import defaultdict, deque
+import queue
 import time
-
-
-MAX_CONNECTIONS = 10
+import random
+from scheduler import MAX_ATTEMPTS
+from download_sink import DownloadSink, covered_chunks
+from shared_index import SharedIndex
+from catalog import FileCatalog
+from chunk_cache import ChunkCache
+from file_cache import FileHandleCache
+from dht import DHT
+from failure_detector import FailureDetector
+from neighbors import Neighbor, NeighborTable
+from lamport import LamportClock
+from log import Truncated
+from connection import ConnectionPool, ServerConnection, send_file_range, SERVER_IDLE_TIMEOUT, SERVER_IO_TIMEOUT
+
+
+MAX_CONNECTIONS = 10       # Backlog do listen
+SERVER_WORKERS = 32        # Mensagens atendidas simultaneamente pelo servidor
+SERVER_QUEUE_LIMIT = 128   # Conexões com mensagem esperando um worker antes de o servidor recusar novas
+IDLE_SWEEP_INTERVAL = 1.0  # Intervalo em que o servidor fecha as conexões ociosas há mais de SERVER_IDLE_TIMEOUT
+ACCEPT_RETRY_DELAY = 0.5   # Pausa nos accepts quando faltam descritores de arquivo ou memória [s]
+ACCEPT_RESOURCE_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+MAX_RANGE_CHUNKS = 1024    # Chunks atendidos por um único DL_RANGE
+TRANSFER_HISTORY = 20      # Downloads recentes usados na escolha automática do tamanho de chunk
+MSG_MORE = getattr(socket, "MSG_MORE", 0)  # Junta o cabeçalho FILEB com os bytes enviados pelo sendfile
+QUERY_DEADLINE = 3.0       # Prazo total de uma consulta (LS, GET_PEERS) enviada a todos os vizinhos [s]
+GOSSIP_INTERVAL = 1.0      # Intervalo médio entre rodadas de gossip [s]
+GOSSIP_FANOUT = 2          # Vizinhos sorteados a cada rodada
+GOSSIP_MAX_ENTRIES = 32    # Entradas da tabela de vizinhos enviadas em cada mensagem GOSSIP
+GOSSIP_TIMEOUT = 1.0       # Prazo de uma troca de gossip [s]
+HAVE_TIMEOUT = 1.0         # Prazo para um peer com o arquivo incompleto dizer quais chunks tem [s]
+RANGE_UNSUPPORTED_TTL = 300.0  # Tempo que um peer que não aceitou DL_RANGE recebe só DL antes de ser testado de novo [s]
+
+logger = logging.getLogger(__name__)
 
 
 # Classe que representa um peer
 class Peer:
-    def __init__(self, ip, port, shared_directory, status, neighbors, chunck_size):
+    def __init__(self, ip, port, shared_directory, status, neighbors, chunck_size,
+                 server_workers=SERVER_WORKERS, server_queue_limit=SERVER_QUEUE_LIMIT):
         self.ip = ip
         self.port = port
         self.shared_directory = shared_directory
         self.status = status
-        self.clock = 0
-        self.neighbors = neighbors
+        self.clock = LamportClock()
+        self.neighbors = NeighborTable(neighbors)
         self.chunck_size = chunck_size
-        self.received_files = []
-        self.received_chunks = {}
+        self.catalog = FileCatalog()
+        self.active_downloads = {}
+        self.chunk_maps = {}  # ((ip, porta), arquivo) -> resposta HAVE_MAP ainda não consumida
+        self.shared_index = SharedIndex(shared_directory, ip, port)
+        self.chunk_cache = ChunkCache()
+        self.file_cache = FileHandleCache()
+        # Pede os chunks no modo binário (FILEB); peers que só falam texto continuam respondendo com FILE
+        self.binary_transfer = True
+        # Aceita chunks comprimidos; o servidor decide por arquivo se compensa, e peers antigos ignoram a opção
+        self.compressed_transfer = True
+        self.compression = compression.CompressionPolicy()
+        # Pede lotes de chunks com DL_RANGE; peers que não o conhecem passam a receber DL chunk a chunk
+        self.range_requests = True
+        self.range_unsupported = {}  # (ip, porta) -> instante até o qual o peer recebe DL chunk a chunk
         self.download_stats = defaultdict(list)
+        self.transfer_history = deque(maxlen=TRANSFER_HISTORY)
+        self.pool = ConnectionPool()
+        self.server_workers = server_workers
+        self.server_queue_limit = server_queue_limit
+        self.server_lock = threading.Lock()
+        self.server_stats = {
+            "accepted": 0,
+            "rejected": 0,
+            "queued": 0,
+            "max_queued": 0,
+            "active": 0,
+            "idle": 0
+        }
+        self.gossip_stop = threading.Event()
+        self.dht = DHT(self)
+        self.detector = FailureDetector(self)
+        self.handlers = protocol.HandlerRegistry()
+        self.register_handlers()
         self.start_server()
 
     def increment_clock(self):
-        self.clock += 1
-        print(f" => Atualizando relogio para {self.clock}")
+        clock = self.clock.tick()
+        logger.debug(" => Atualizando relogio para %s", clock)
+        return clock
 
     # Método de classe para criar um peer usando o arquivo de vizinhos fornecido
     @classmethod
-    def create_peer(cls, ip, port, shared_directory, status, neighbors_file, chunck_size):
+    def create_peer(cls, ip, port, shared_directory, status, neighbors_file, chunck_size, **kwargs):
         neighbors = []
         try:
             with open(neighbors_file, "r") as file_vizinhos:
@@ -41,47 +109,176 @@ class Peer:
                 line = line.strip()
                 if line:
                     neigh_ip, neigh_port = line.split(":")
-                    new_neighbor = {
-                        "ip": neigh_ip,
-                        "port": neigh_port,
-                        "status": "OFFLINE",
-                        "clock": 0
-                    }
-                    neighbors.append(new_neighbor)
+                    neighbors.append(Neighbor(neigh_ip, neigh_port, "OFFLINE", 0))
 
         except Exception as e:
-            print(f"[Erro] Não foi possível ler o arquivo de vizinhos {neighbors_file}: {e}")
+            logger.error("[Erro] Não foi possível ler o arquivo de vizinhos %s: %s", neighbors_file, e)
             exit(0)
 
         for neighbor in neighbors:
-            print(f"Adicionando novo peer {neighbor['ip']}:{neighbor['port']} status OFFLINE")
-        return cls(ip, port, shared_directory, status, neighbors, chunck_size)
+            logger.info("Adicionando novo peer %s:%s status OFFLINE", neighbor.ip, neighbor.port)
+        return cls(ip, port, shared_directory, status, neighbors, chunck_size, **kwargs)
 
     # Método para iniciar o servidor que escuta por conexões de outros peers
+    # As mensagens são atendidas por um pool limitado de workers. Entre uma mensagem e outra as conexões keep-alive
+    # ficam num selector, e só voltam para a fila dos workers quando chega a próxima mensagem: uma conexão ociosa
+    # não prende um worker, por mais conexões que estejam abertas. Com a fila cheia, novas conexões são recusadas.
     def start_server(self):
+        pending_connections = queue.Queue()
+        returned_connections = queue.SimpleQueue()  # Devolvidas pelos workers, esperando voltar ao selector
+        wakeup_recv, wakeup_send = socket.socketpair()
+        wakeup_recv.setblocking(False)
+        wakeup_send.setblocking(False)
+
+        # Workers daemon, para não segurarem o encerramento do programa enquanto atendem conexões
+        def worker_thread():
+            while True:
+                connection = pending_connections.get()
+                if self.serve_connection(connection):
+                    returned_connections.put(connection)
+                    try:
+                        wakeup_send.send(b"\0")
+                    except OSError:
+                        # Buffer cheio: o dispatcher já tem um aviso pendente
+                        pass
+
+        for _ in range(self.server_workers):
+            threading.Thread(target=worker_thread, daemon=True).start()
+
         def server_thread():
             try:
                 server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 server.bind((self.ip, int(self.port)))
                 server.listen(MAX_CONNECTIONS)
+                server.setblocking(False)
+                selector = selectors.DefaultSelector()
+                selector.register(server, selectors.EVENT_READ)
+                selector.register(wakeup_recv, selectors.EVENT_READ)
+                last_sweep = time.monotonic()
+                accept_resume = None  # Instante em que o listen volta ao selector após uma pausa nos accepts
 
                 while True:
-                    conn, addr = server.accept()
-                    data = conn.recv(1024).decode()
-                    if data:
-                        self.handle_command(data, conn)
-                    conn.close()
+                    timeout = IDLE_SWEEP_INTERVAL
+                    if accept_resume is not None:
+                        timeout = min(timeout, max(0.0, accept_resume - time.monotonic()))
+                    for key, _ in selector.select(timeout):
+                        if key.fileobj is server:
+                            if not self.accept_connection(server, selector):
+                                # Sem recursos para a conexão: ela fica no backlog e o listen sai do selector, que
+                                # senão voltaria na hora com o mesmo erro
+                                selector.unregister(server)
+                                accept_resume = time.monotonic() + ACCEPT_RETRY_DELAY
+                        elif key.fileobj is wakeup_recv:
+                            try:
+                                wakeup_recv.recv(4096)
+                            except BlockingIOError:
+                                pass
+                        else:
+                            # Chegou uma mensagem: a conexão sai do selector até um worker terminar de atendê-la
+                            selector.unregister(key.fileobj)
+                            self.queue_connection(key.fileobj, pending_connections)
+                    while not returned_connections.empty():
+                        selector.register(returned_connections.get(), selectors.EVENT_READ)
+                    now = time.monotonic()
+                    if now - last_sweep >= IDLE_SWEEP_INTERVAL:
+                        last_sweep = now
+                        self.close_idle_connections(selector, now)
+                    if accept_resume is not None and now >= accept_resume:
+                        selector.register(server, selectors.EVENT_READ)
+                        accept_resume = None
+                    with self.server_lock:
+                        self.server_stats["idle"] = len(selector.get_map()) - (2 if accept_resume is None else 1)
 
             except Exception as e:
-                print(f"[Erro] {self.ip}:{self.port} não está disponível: {e}")
+                logger.error("[Erro] %s:%s não está disponível: %s", self.ip, self.port, e)
                 exit(0)
 
         threading.Thread(target=server_thread, daemon=True).start()
 
-    def lamport_verify(self ,sender_clock):
-        if sender_clock > self.clock:
-            self.clock = sender_clock
-            print(f"=> Atualizando relogio para {self.clock} #Atualização de clock")   
+    # Aceita uma conexão do listen. Um erro no accept (ex.: ECONNABORTED) só perde aquela conexão; retorna False
+    # quando faltam descritores ou memória, para o servidor parar de aceitar por um tempo.
+    def accept_connection(self, server, selector):
+        try:
+            conn, addr = server.accept()
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            logger.error("[Erro] Falha ao aceitar conexão: %s", e)
+            return e.errno not in ACCEPT_RESOURCE_ERRORS
+        with self.server_lock:
+            if self.server_stats["queued"] >= self.server_queue_limit:
+                self.server_stats["rejected"] += 1
+                conn.close()
+                return True
+            self.server_stats["accepted"] += 1
+        try:
+            # A espera pela próxima mensagem fica no selector; o prazo do socket vale para os envios e para terminar
+            # de ler uma mensagem que já começou a chegar
+            conn.settimeout(SERVER_IO_TIMEOUT)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            # O cliente já desistiu (ex.: ECONNRESET); a conexão é descartada
+            logger.error("[Erro] Falha ao aceitar conexão de %s:%s: %s", addr[0], addr[1], e)
+            conn.close()
+            return True
+        selector.register(ServerConnection(conn), selectors.EVENT_READ)
+        return True
+
+    def queue_connection(self, connection, pending_connections):
+        with self.server_lock:
+            self.server_stats["queued"] += 1
+            self.server_stats["max_queued"] = max(self.server_stats["max_queued"], self.server_stats["queued"])
+        pending_connections.put(connection)
+
+    @staticmethod
+    def close_idle_connections(selector, now):
+        for key in list(selector.get_map().values()):
+            connection = key.fileobj
+            if isinstance(connection, ServerConnection) and now - connection.last_used >= SERVER_IDLE_TIMEOUT:
+                selector.unregister(connection)
+                connection.close()
+
+    # Executado por um worker do pool: contabiliza a fila e atende a conexão. Retorna se ela continua aberta.
+    def serve_connection(self, connection):
+        with self.server_lock:
+            self.server_stats["queued"] -= 1
+            self.server_stats["active"] += 1
+        try:
+            return self.handle_connection(connection)
+        finally:
+            with self.server_lock:
+                self.server_stats["active"] -= 1
+
+    # Atende as mensagens que chegaram numa conexão, até o buffer esvaziar. Retorna True se a conexão continua
+    # aberta (ela volta ao selector para esperar a próxima mensagem) e False se foi fechada.
+    def handle_connection(self, connection):
+        try:
+            while True:
+                line, payload = self.read_message(connection.reader)
+                if line is None:
+                    break
+                data = line.decode()
+                if data.strip():
+                    self.handle_command(data, connection.sock, payload)
+                if not connection.reader.decoder.buffered():
+                    connection.last_used = time.monotonic()
+                    return True
+        except OSError:
+            pass
+        except Exception as e:
+            logger.error("[Erro] Falha ao processar mensagem: %s", e)
+        connection.close()
+        return False
+
+    # Lê uma mensagem do leitor: a linha de cabeçalho e, para FILEB, os bytes que a seguem
+    @staticmethod
+    def read_message(reader):
+        return reader.read_message()
+
+    def lamport_verify(self, sender_clock):
+        clock = self.clock.merge(sender_clock)
+        logger.debug("=> Atualizando relogio para %s", clock)
+        return clock
 
     def add_download_stat(self, file_name, file_size, chunk_size, num_peers, duration):
         """Adiciona estatísticas de download para um arquivo específico"""
@@ -94,6 +291,42 @@ class Peer:
                 "duration": []
             }
         self.download_stats[file_name]["duration"].append(duration)
+        if duration > 0:
+            # Vazão média entregue por peer, usada pela escolha automática do tamanho de chunk
+            self.transfer_history.append(file_size / duration / max(1, num_peers))
+
+    def recent_throughput(self):
+        """Mediana da vazão por peer nos downloads recentes, ou None sem histórico"""
+        if not self.transfer_history:
+            return None
+        return statistics.median(self.transfer_history)
+
+    def report_scheduler(self, scheduler):
+        """Mostra quantos chunks foram repassados, duplicados ou perdidos durante um download"""
+        if scheduler.rerouted or scheduler.hedges:
+            print(f"{scheduler.rerouted} chunks repassados a outros peers, {scheduler.hedges} pedidos em duplicata")
+        for peer, state in scheduler.peers.items():
+            if state.disabled:
+                print(f"Peer {peer[0]}:{peer[1]} retirado do download após {state.failed} falhas")
+        if scheduler.failed_chunks:
+            print(f"Desistindo de {len(scheduler.failed_chunks)} chunks após {MAX_ATTEMPTS} tentativas")
+
+    def range_supported(self, peer):
+        """Se os chunks são pedidos ao peer com DL_RANGE; um peer que não o aceitou volta a ser testado depois de
+        RANGE_UNSUPPORTED_TTL (ex.: foi atualizado, ou só estava ocupado)"""
+        expires = self.range_unsupported.get(peer)
+        if expires is not None and expires <= time.monotonic():
+            self.range_unsupported.pop(peer, None)
+            expires = None
+        return expires is None
+
+    def mark_range_unsupported(self, peer):
+        self.range_unsupported[peer] = time.monotonic() + RANGE_UNSUPPORTED_TTL
+
+    def neighbors_rtt(self, peers):
+        """Maior RTT medido até os peers dados, ou None se nenhum foi medido"""
+        samples = [self.pool.rtt[(ip, int(port))] for ip, port in peers if (ip, int(port)) in self.pool.rtt]
+        return max(samples) if samples else None
 
     def print_statistics(self):
         """Printa as estatísticas de download formatadas"""
@@ -119,263 +352,564 @@ class Peer:
         except Exception as e:
             print(f"Erro ao exibir estatísticas: {e}")
 
+        stats = self.server_stats
+        print(f"\nServidor: {stats['active']} conexões ativas, {stats['idle']} ociosas, {stats['queued']} na fila "
+              f"(máx. {stats['max_queued']}), {stats['accepted']} aceitas, {stats['rejected']} recusadas")
+        cache = self.chunk_cache.stats()
+        print(f"Cache de chunks: {cache['hits']} acertos, {cache['misses']} faltas, {cache['entries']} chunks "
+              f"({cache['bytes'] / 1024:.0f} KB)")
+        files = self.file_cache.stats()
+        print(f"Arquivos abertos: {files['open']} (reaproveitados {files['hits']} vezes, {files['opens']} aberturas)")
+        compressed = self.compression.stats()
+        if compressed["raw"]:
+            print(f"Compressão: {compressed['raw'] / 1024:.0f} KB enviados como {compressed['sent'] / 1024:.0f} KB "
+                  f"({compressed['skipped_files']} arquivo(s) sem compressão por não compensar)")
+
+
+    # Associa cada verbo do protocolo ao seu tratador. Mensagens periódicas (gossip, heartbeat, DHT) não são
+    # registradas no log; as de dados só em DEBUG.
+    def register_handlers(self):
+        register = self.handlers.register
+        register("HELLO", self.handle_hello, logging.INFO)
+        register("GET_PEERS", self.handle_get_peers, logging.INFO)
+        register("PEER_LIST", self.handle_peer_list, logging.INFO)
+        register("BYE", self.handle_bye, logging.INFO)
+        register("LS", self.handle_ls, logging.INFO)
+        register("LS_LIST", self.handle_ls_list, logging.INFO)
+        register("DL", self.handle_dl, logging.DEBUG)
+        register("DL_RANGE", self.handle_dl_range, logging.DEBUG)
+        register("RANGE_END", self.handle_range_end, logging.DEBUG)
+        register("FILE", self.handle_file, logging.DEBUG)
+        register("HAVE", self.handle_have, logging.DEBUG)
+        register("HAVE_MAP", self.handle_have_map, logging.DEBUG)
+        register("GOSSIP", self.handle_gossip)
+        register("GOSSIP_ACK", self.handle_gossip_ack)
+        register("PING", self.handle_ping)
+        register("PONG", self.handle_pong)
+        register("FIND_NODE", self.dht.handle_find_node)
+        register("FIND_FILE", self.dht.handle_find_file)
+        register("STORE", self.dht.handle_store)
+        register("NODES", self.dht.handle_nodes)
+        register("FILE_HOLDERS", self.dht.handle_file_holders)
+
+    # Método para lidar com os comandos recebidos: a mensagem é interpretada uma única vez e entregue ao tratador
+    # do verbo, depois de o relógio ser atualizado segundo o modelo de Lamport. Retorna a mensagem interpretada.
+    # Um FILEB chega com chunk = (cabeçalho já interpretado pelo leitor, conteúdo) e vai direto para
+    # handle_chunk_frame, sem Message (retorna None).
+    def handle_command(self, command, conn, chunk=None):
+        if chunk is not None:
+            self.handle_chunk_frame(command, *chunk)
+            return None
+        message = protocol.parse(command)
+        entry = self.handlers.get(message.verb)
+        if entry is None:
+            logger.debug("Verbo desconhecido: '%s'", Truncated(command))
+            return message
+        handler, log_level = entry
+
+        if message.sender_port.isdigit():
+            self.neighbors.observe_clock(message.sender_ip, message.sender_port, message.clock)
+        if log_level is None:
+            self.clock.merge(message.clock)
+        else:
+            logger.log(log_level, "Mensagem recebida: '%s'", Truncated(command))
+            self.lamport_verify(message.clock)
+        handler(message, conn)
+        return message
 
-    # Método para lidar com os comandos recebidos
-    def handle_command(self, command, conn):
-        splitted_command = command.split()
+    # Envia uma mensagem como resposta na conexão em que o pedido chegou
+    def reply(self, conn, verb, *args):
+        conn.sendall(protocol.format_message(self.ip, self.port, self.clock.tick(), verb, *args).encode())
 
-        sender_clock = int(splitted_command[1])
-        sender_ip = splitted_command[0].split(":")[0]
-        sender_port = splitted_command[0].split(":")[1]
+    def handle_hello(self, message, conn):
+        self.change_neighbor_status(message.sender_ip, message.sender_port, "ONLINE", message.clock)
 
-        #Atualizando clock segundo modelo de Lamport
+    def handle_get_peers(self, message, conn):
+        vizinhos = []
         for neighbor in self.neighbors:
-            if(neighbor['ip'] == sender_ip and neighbor['port'] == sender_port):
-                neighbor['clock'] = int(neighbor['clock'])
-                if neighbor['clock'] < sender_clock:
-                    neighbor['clock'] = sender_clock
-
-        # Verifica se o comando recebido é do tipo HELLO
-        if (splitted_command[2] == "HELLO"):
-            formated_command = helpers.format_string(command)
-            print(f"Mensagem recebida: '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")    
-                self.increment_clock()
-            else:
-                self.increment_clock()
-            self.change_neighbor_status(sender_ip, sender_port, "ONLINE", sender_clock)
-
-        # Verifica se o comando recebido é do tipo GET_PEERS
-        elif (splitted_command[2] == "GET_PEERS"):
-            formated_command = helpers.format_string(command)
-            print(f"Resposta recebida: '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")  
-                self.increment_clock()  
-            else:
-                self.increment_clock()
-            vizinhos = []
-            for neighbor in self.neighbors:
-                if (neighbor['port'] != sender_port):
-                    vizinhos.append(
-                        f"{neighbor['ip']}:{neighbor['port']}:{neighbor['status']}:{neighbor['clock']}")
-            peers_str = " ".join(vizinhos)
-
-            self.increment_clock()
-            response = f"{self.ip}:{self.port} {self.clock} PEER_LIST {len(self.neighbors)} {peers_str}\n"
-            formated_response = helpers.format_string(response)
-            print(
-                f"Encaminhando mensagem '{formated_response}' para {sender_ip}:{sender_port}")
-            conn.sendall(response.encode())
+            if (str(neighbor.port) != message.sender_port):
+                vizinhos.append(
+                    f"{neighbor.ip}:{neighbor.port}:{neighbor.status}:{neighbor.clock}")
+
+        clock = self.increment_clock()
+        response = protocol.format_message(self.ip, self.port, clock, "PEER_LIST", len(self.neighbors), *vizinhos)
+        logger.info("Encaminhando mensagem '%s' para %s:%s", Truncated(response), message.sender_ip, message.sender_port)
+        conn.sendall(response.encode())
+
+    def handle_peer_list(self, message, conn):
+        # Atualiza o status do peer que enviou a lista para ONLINE
+        self.change_neighbor_status(message.sender_ip, message.sender_port, "ONLINE", message.clock)
+
+        num_peers = int(message.args[0])
+        # O contador inclui o próprio destinatário, que não vem na lista: lê só as entradas presentes
+        for peer_info in message.args[1:1 + num_peers]:
+            parts = peer_info.split(":")
+            if len(parts) >= 4 and parts[1].isdigit() and parts[3].isdigit():
+                ip, port, status, clock = parts[0], parts[1], parts[2], int(parts[3])
+                # Não adiciona a si mesmo
+                if ip == self.ip and str(self.port) == port:
+                    continue
+                # Só adiciona se ainda não existe na tabela
+                self.neighbors.add(ip, port, status, clock)
+
+    def handle_bye(self, message, conn):
+        self.change_neighbor_status(message.sender_ip, message.sender_port, "OFFLINE", message.clock)
+        # Os arquivos anunciados pelo peer deixam de estar disponíveis
+        self.catalog.remove_peer(message.sender)
+        self.detector.forget(message.sender)
+
+    def handle_ls(self, message, conn):
+        # A listagem vem do índice do diretório, já serializada
+        response_body, summary = self.shared_index.listing()
+        # Downloads em andamento vão com um quinto campo, que versões antigas ignoram. Mesmo sem nenhum chunk ainda:
+        # quem baixa o mesmo arquivo passa a consultá-lo com HAVE e pede os chunks que ele for recebendo.
+        partial = [f"{name}:{sink.file_size}:{self.ip}:{self.port}:partial"
+                   for name, sink in list(self.active_downloads.items())]
+        clock = self.clock.tick()
+        response = protocol.format_message(self.ip, self.port, clock, "LS_LIST", response_body, *partial)
+        logger.info("Encaminhando mensagem %s:%s %s LS_LIST %s %s para %s:%s", self.ip, self.port, clock,
+                    len(self.shared_index.entries), Truncated(summary), message.sender_ip, message.sender_port)
+        conn.sendall(response.encode())
+
+    def handle_ls_list(self, message, conn):
+        for entry in message.args[1:]:
+            parts = entry.split(":")
+            if len(parts) in (4, 5) and parts[1].isdigit() and parts[3].isdigit():
+                self.catalog.add(parts[0], parts[1], (parts[2], parts[3]), partial=parts[4:] == ["partial"])
+
+    def handle_dl(self, message, conn):
+        file_name = message.args[0]
+        chunk_size = int(message.args[1])
+        chunk_index = int(message.args[2])
+        binary = "BIN" in message.args[3:]
+        codec = compression.negotiate(message.args[3:])
+        sent = self.send_chunks(conn, file_name, chunk_size, [chunk_index], binary, codec)
+        if sent:
+            logger.debug("Enviando chunk %s do arquivo %s para %s:%s", chunk_index, file_name,
+                         message.sender_ip, message.sender_port)
+        elif sent == 0:
+            # Download em andamento que ainda não tem o chunk: responde sem conteúdo, para o pedido falhar logo
+            self.reply(conn, "RANGE_END", file_name, 0)
+        else:
+            logger.warning("Arquivo %s não encontrado.", file_name)
+
+    # DL_RANGE: vários chunks num mesmo pedido
+    def handle_dl_range(self, message, conn):
+        file_name = message.args[0]
+        chunk_size = int(message.args[1])
+        chunk_indices = helpers.parse_chunk_ranges(message.args[2], MAX_RANGE_CHUNKS)
+        binary = "BIN" in message.args[3:]
+        codec = compression.negotiate(message.args[3:])
+        # Todos os chunks pedidos vão em sequência na mesma conexão
+        sent = self.send_chunks(conn, file_name, chunk_size, chunk_indices, binary, codec)
+        if sent is not None:
+            logger.debug("Enviando %s chunks do arquivo %s para %s:%s", sent, file_name,
+                         message.sender_ip, message.sender_port)
+        else:
+            logger.warning("Arquivo %s não encontrado.", file_name)
+            sent = 0
+        # Marca o fim da resposta, para que o cliente saiba quando o lote terminou
+        self.reply(conn, "RANGE_END", file_name, sent)
 
-        # Verifica se o comando recebido é do tipo PEER_LIST
-        elif (splitted_command[2] == "PEER_LIST"):
-            formated_command = helpers.format_string(command)
-            print(f"Resposta recebida: '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")  
-                self.increment_clock()  
-            else:
-                self.increment_clock()
-            
-            # Atualiza o status do peer que enviou a lista para ONLINE
-            self.change_neighbor_status(sender_ip, sender_port, "ONLINE", sender_clock)
-            
-            num_peers = int(splitted_command[3])
-            for i in range(num_peers):
-                peer_info = splitted_command[4 + i]
-                parts = peer_info.split(":")
-                if len(parts) >= 4:
-                    ip, port, status, clock = parts[0], parts[1], parts[2], int(parts[3])
-                    # Não adiciona a si mesmo
-                    if ip == self.ip and str(self.port) == port:
-                        continue
-                    # Verifica se já existe na lista
-                    exists = any(n['ip'] == ip and str(n['port']) == port for n in self.neighbors)
-                    if not exists:
-                        self.neighbors.append({
-                            "ip": ip,
-                            "port": port,
-                            "status": status,
-                            "clock": clock
-                        })
-                
+    def handle_range_end(self, message, conn):
+        # Só encerra o lote (ver receive_range_response)
+        pass
 
-        # Verifica se o comando recebido é do tipo BYE
-        elif (splitted_command[2] == "BYE"):
-            formated_command = helpers.format_string(command)
-            print(f"Mensagem recebida '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}") 
-                self.increment_clock()   
-            else:
-                self.increment_clock()
-            self.change_neighbor_status(sender_ip, sender_port, "OFFLINE", sender_clock)
-
-        # Verifica se o comando recebido é do tipo LS
-        elif (splitted_command[2] == "LS"):
-            formated_command = helpers.format_string(command)
-            print(f"Mensagem recebida '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")    
-                self.increment_clock()
-            else:
-                self.increment_clock()
-            files = helpers.list_local_files(self.shared_directory)
-            files_str = []
-            files_without_ip = []
-
-            for file in files:
-                file_size = os.path.getsize(
-                    os.path.join(self.shared_directory, file))
-                files_str.append(f"{file}:{file_size}:{self.ip}:{self.port}")
-                files_without_ip.append(f"{file}:{file_size}")
-
-            formated_files = " ".join(files_str)
-            response = f"{self.ip}:{self.port} {self.clock} LS_LIST {len(files)} {formated_files}\n"
-            formated_response = helpers.format_string(response)
-            print(
-                f"Encaminhando mensagem {self.ip}:{self.port} {self.clock} LS_LIST {len(files)} { ' '.join(files_without_ip) } para {sender_ip}:{sender_port}")
+    def handle_file(self, message, conn):
+        try:
+            file_name = message.args[0]
+            chunk_index = int(message.args[2])
+            file_data = base64.b64decode(message.args[3])
+            # Um quinto campo indica o chunk comprimido
+            if len(message.args) > 4:
+                file_data = compression.decompress(message.args[4], file_data, int(message.args[1]))
+            self.store_chunk_data(file_name, chunk_index, file_data)
+        except Exception as e:
+            logger.error("Erro ao processar chunk: %s", e)
+
+    # FILEB: chunk em modo binário. É o caminho de cada chunk recebido, então não passa por uma Message nem pelo
+    # registro de verbos: o cabeçalho já vem interpretado pelo leitor, que precisou dele para ler o conteúdo.
+    def handle_chunk_frame(self, command, header, payload):
+        sender_ip, sender_port, clock, file_name, chunk_size, chunk_index, size, codec = header
+        if sender_port.isdigit():
+            self.neighbors.observe_clock(sender_ip, sender_port, clock)
+        logger.debug("Mensagem recebida: '%s'", Truncated(command))
+        self.lamport_verify(clock)
+        try:
+            if len(payload) != size:
+                raise ValueError("conteúdo do chunk incompleto")
+            if codec is not None:
+                payload = compression.decompress(codec, payload, chunk_size)
+            self.store_chunk_data(file_name, chunk_index, payload)
+        except Exception as e:
+            logger.error("Erro ao processar chunk: %s", e)
+
+    # HAVE: quais chunks do arquivo este peer tem. Responde com HAVE_MAP <arquivo> <tamanho de chunk> <bitmap>, em
+    # que o bitmap é ALL (arquivo completo), NONE ou o bitmap do download em andamento em base64.
+    def handle_have(self, message, conn):
+        file_name = message.args[0]
+        file_size = int(message.args[1])
+        chunk_size, bitmap = 0, "NONE"
+        sink = self.active_downloads.get(file_name)
+        try:
+            complete = os.path.getsize(os.path.join(self.shared_directory, file_name)) == file_size
+        except OSError:
+            complete = False
+        if complete:
+            bitmap = "ALL"
+        elif sink is not None and sink.file_size == file_size:
+            chunk_size, bitmap = sink.chunk_size, base64.b64encode(sink.bitmap_snapshot()).decode()
+        self.reply(conn, "HAVE_MAP", file_name, chunk_size, bitmap)
+
+    def handle_have_map(self, message, conn):
+        self.chunk_maps[(message.sender, message.args[0])] = message.args[1:3]
+
+    # GOSSIP: resumo da tabela de vizinhos de outro peer, respondido com o próprio resumo (push-pull)
+    def handle_gossip(self, message, conn):
+        self.merge_gossip(message.sender_ip, message.sender_port, message.clock, message.args)
+        self.reply(conn, "GOSSIP_ACK", self.gossip_digest())
+
+    # GOSSIP_ACK: resposta a um GOSSIP enviado
+    def handle_gossip_ack(self, message, conn):
+        self.merge_gossip(message.sender_ip, message.sender_port, message.clock, message.args)
+
+    # PING: sondagem do detector de falhas, respondida com PONG
+    def handle_ping(self, message, conn):
+        self.reply(conn, "PONG")
+
+    def handle_pong(self, message, conn):
+        pass
+
+    # Envia os chunks pedidos de um arquivo compartilhado, retornando quantos foram enviados (None se o arquivo não
+    # existe). O arquivo vem do cache de arquivos abertos e os chunks, quando possível, do cache de chunks.
+    def send_chunks(self, conn, file_name, chunk_size, chunk_indices, binary, codec=None):
+        handle = self.file_cache.acquire(os.path.join(self.shared_directory, file_name))
+        if handle is None:
+            sink = self.active_downloads.get(file_name)
+            return None if sink is None else self.send_partial_chunks(conn, sink, file_name, chunk_size,
+                                                                      chunk_indices, binary, codec)
+        sent = 0
+        try:
+            for chunk_index in chunk_indices:
+                entry = self.chunk_cache.get(file_name, handle.version, chunk_size, chunk_index, (binary, codec))
+                if entry is None:
+                    entry = self.read_chunk(handle, file_name, chunk_size, chunk_index, binary, codec)
+                self.send_chunk(conn, handle, file_name, chunk_size, chunk_index, binary, *entry)
+                sent += 1
+        finally:
+            self.file_cache.release(handle)
+        return sent
+
+    # Envia os chunks pedidos que um download em andamento já recebeu; os que ainda faltam são pulados (o RANGE_END
+    # informa quantos foram enviados). Não passam pelo cache de chunks, já que o arquivo ainda está sendo escrito.
+    def send_partial_chunks(self, conn, sink, file_name, chunk_size, chunk_indices, binary, codec=None):
+        sent = 0
+        for chunk_index in chunk_indices:
+            offset = chunk_index * chunk_size
+            data = sink.read_range(offset, min(chunk_size, sink.file_size - offset))
+            if data is None:
+                continue
+            self.send_chunk(conn, None, file_name, chunk_size, chunk_index, binary,
+                            *self.encode_chunk(file_name, data, binary, codec))
+            sent += 1
+        return sent
+
+    # Forma em que um chunk é enviado: (compressão usada ou None, conteúdo), comprimido se compensar para o arquivo
+    # e em base64 no modo texto
+    def encode_chunk(self, file_name, data, binary, codec):
+        used, data = self.compression.compress(file_name, codec, data) if codec else (None, data)
+        if not binary:
+            data = base64.b64encode(data).decode()
+        return used, data
+
+    # Lê um chunk na forma em que é enviado e o guarda no cache. Chunks binários sem compressão não passam pelo
+    # cache e retornam (None, None): são enviados direto do arquivo com sendfile.
+    def read_chunk(self, handle, file_name, chunk_size, chunk_index, binary, codec):
+        if binary and codec is None:
+            return None, None
+        entry = self.encode_chunk(file_name, handle.read(chunk_index * chunk_size, chunk_size), binary, codec)
+        self.chunk_cache.put(file_name, handle.version, chunk_size, chunk_index, (binary, codec), entry)
+        return entry
+
+    # Envia um chunk como FILEB (binário) ou FILE (base64), com o nome da compressão no fim quando comprimido.
+    # Sem o conteúdo em memória, o FILEB sai do arquivo aberto com sendfile.
+    def send_chunk(self, conn, handle, file_name, chunk_size, chunk_index, binary, codec=None, data=None):
+        extra = (codec,) if codec else ()
+        if not binary:
+            response = protocol.format_message(self.ip, self.port, self.clock.value, "FILE", file_name, chunk_size,
+                                               chunk_index, data, *extra)
             conn.sendall(response.encode())
-
-        # Verifica se o comando recebido é do tipo LS_LIST
-        elif (splitted_command[2] == "LS_LIST"):
-            formated_command = helpers.format_string(command)
-            print(f"Resposta recebida: '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")    
-                self.increment_clock()
-            else:
-                self.increment_clock()
-            files_entries = command.split()[4:]
-            for entry in files_entries:
-                parts = entry.split(":")
-                if len(parts) == 4:
-                    file_dict = {
-                        "name": parts[0],
-                        "size": parts[1],
-                        "peer": f"{parts[2]}:{parts[3]}"
-                    }
-
-                    grouped = False
-                    for existing_file in self.received_files:
-                        if existing_file["name"] == file_dict["name"] and existing_file["size"] == file_dict["size"]:
-                            existing_file["peer"] += f", {file_dict['peer']}"
-                            grouped = True
-                            break
-                    if not grouped:
-                        self.received_files.append({
-                            "name": file_dict["name"],
-                            "size": file_dict["size"],
-                            "peer": file_dict["peer"]
-                        })
-
-        # Verifica se o comando recebido é do tipo DL
-        elif (splitted_command[2] == "DL"):
-            formated_command = helpers.format_string(command)
-            print(f"Mensagem recebida '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")  
-                self.increment_clock()  
-            else:
-                self.increment_clock()
-            file_name = splitted_command[3]
-            chunk_size = int(splitted_command[4])
-            chunk_index = int(splitted_command[5])
-            file_path = os.path.join(self.shared_directory, file_name)
-            if os.path.exists(file_path):
-                with open(file_path, "rb") as file:
-                    file.seek(chunk_index * chunk_size)
-                    data = file.read(chunk_size)
-                    b64_data = base64.b64encode(data).decode()
-                response = f"{self.ip}:{self.port} {self.clock} FILE {file_name} {chunk_size} {chunk_index} {b64_data}\n"
-                conn.sendall(response.encode())
-                print(
-                    f"Enviando chunk {chunk_index} do arquivo {file_name} para {sender_ip}:{sender_port}")
-            else:
-                print(f"Arquivo {file_name} não encontrado.")
-
-        # Verifica se o comando recebido é do tipo FILE
-        elif (splitted_command[2] == "FILE"):
-            formated_command = helpers.format_string(command)
-            print(f"Mensagem recebida: '{formated_command}'")
-            if sender_clock > self.clock:
-                self.clock = sender_clock
-                print(f"=> Atualizando relogio para {self.clock}")   
-                self.increment_clock() 
-            else:
-                self.increment_clock()
-        
-            try:
-                file_name = splitted_command[3]
-                chunk_size = int(splitted_command[4])
-                chunk_index = int(splitted_command[5])
-                b64_data = command.split(" ", 6)[-1].strip()
-                file_data = base64.b64decode(b64_data)
-                self.store_chunk_data(file_name, chunk_index, file_data)
-            except Exception as e:
-                print(f"Erro ao processar chunk: {e}")
+        elif data is not None:
+            header = protocol.format_message(self.ip, self.port, self.clock.value, "FILEB", file_name, chunk_size,
+                                             chunk_index, len(data), *extra)
+            # Cabeçalho e conteúdo em envios separados, sem copiar o chunk para juntá-los
+            conn.sendall(header.encode(), MSG_MORE)
+            conn.sendall(data)
+        else:
+            # Cabeçalho em texto com o tamanho do conteúdo, seguido dos bytes do chunk enviados com sendfile
+            offset = chunk_index * chunk_size
+            length = max(0, min(chunk_size, handle.size - offset))
+            header = protocol.format_message(self.ip, self.port, self.clock.value, "FILEB", file_name, chunk_size,
+                                             chunk_index, length)
+            conn.sendall(header.encode(), MSG_MORE)
+            send_file_range(conn, handle.file, offset, length)
+
+    # Opções dos pedidos de chunks (DL e DL_RANGE): modo binário e compressores aceitos
+    def transfer_options(self):
+        options = ("BIN",) if self.binary_transfer else ()
+        if self.compressed_transfer:
+            options += (compression.request_option(),)
+        return options
+
+    # Envia um pedido DL_RANGE numa conexão do pool, sem esperar a resposta (permite enfileirar vários pedidos)
+    def send_range_request(self, conn, file_name, chunk_size, chunk_indices):
+        clock = self.increment_clock()
+        spec = helpers.format_chunk_ranges(chunk_indices)
+        message = protocol.format_message(self.ip, self.port, clock, "DL_RANGE", file_name, chunk_size, spec,
+                                          *self.transfer_options())
+        conn.sock.sendall(message.encode())
+
+    # Processa as respostas de um DL_RANGE até o RANGE_END que o encerra
+    def receive_range_response(self, conn):
+        while True:
+            response, payload = self.read_message(conn.reader)
+            if response is None:
+                raise ConnectionError("conexão encerrada no meio de um DL_RANGE")
+            message = self.handle_command(response.decode(), conn.sock, payload)
+            if message is not None and message.verb == "RANGE_END":
+                return
 
     # Método que envia comandos para outros peers
-    def send_command(self, command, ip, port, expect_response=False) -> bool:
+    def send_command(self, command, ip, port, expect_response=False, timeout=None, quiet=False) -> bool:
         splitted_command = command.split()
         if len(splitted_command) < 3:
-            print("Incorrect message format")
+            logger.error("Incorrect message format")
             return False
         else:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((ip, port))
-                    s.sendall(command.encode())
+            # Uma conexão reaproveitada do pool pode ter sido fechada pelo outro lado; nesse caso tenta de novo com uma nova
+            for attempt in range(2):
+                conn = None
+                try:
+                    conn = self.pool.acquire(ip, port, timeout)
+                    # Prazo da resposta: o do pedido, se houver, ou o padrão do pool
+                    conn.sock.settimeout(timeout or self.pool.response_timeout)
+                    conn.sock.sendall(command.encode())
                     if expect_response:
-                        response = ""
-                        while True:
-                            part = s.recv(4096).decode()
-                            response += part
-                            if "\n" in part:
-                                break
-                        self.handle_command(response, s)
-                return True
-            except Exception as e:
-                print(
-                    f"[Erro] Não foi possível conectar com {ip}:{port} - {e}")
-                return False
+                        response, payload = self.read_message(conn.reader)
+                        if response is None:
+                            raise ConnectionError("conexão encerrada sem resposta")
+                        self.handle_command(response.decode(), conn.sock, payload)
+                    self.pool.release(conn)
+                    return True
+                except Exception as e:
+                    if conn is not None:
+                        self.pool.discard(conn)
+                        # Um prazo esgotado não é conexão velha: repetir só dobraria a espera
+                        if conn.reused and attempt == 0 and not isinstance(e, socket.timeout):
+                            continue
+                    if not quiet:
+                        logger.error("[Erro] Não foi possível conectar com %s:%s - %s", ip, port, e)
+                    return False
 
     # Método que altera o status de um vizinho e o adiciona se não existir
     def change_neighbor_status(self, ip, port, status, clock):
-        for neighbor in self.neighbors:
-            if (neighbor["ip"] == ip and neighbor["port"] == port):
-                # Só atualiza para OFFLINE se o clock for maior
-                if status == "OFFLINE" and int(clock) < int(neighbor["clock"]):
-                    return
-                neighbor["status"] = status
-                neighbor["clock"] = clock
-                print(f"Atualizando peer {ip}:{port} status {status}")
+        result = self.neighbors.update_status(ip, port, status, clock)
+        if result == "updated":
+            logger.info("Atualizando peer %s:%s status %s", ip, port, status)
+        elif result == "added":
+            logger.info("Adicionando novo peer %s:%s status %s", ip, port, status)
+
+    def merge_neighbor(self, ip, port, status, clock, direct=False):
+        """Incorpora uma entrada da tabela de vizinhos recebida por gossip: vale a de maior clock.
+        Com direct, a informação veio do próprio peer e vale também com clock igual."""
+        result = self.neighbors.merge(ip, port, status, clock, direct)
+        if result == "changed":
+            logger.info("Atualizando peer %s:%s status %s", ip, port, status)
+        elif result == "added":
+            logger.info("Adicionando novo peer %s:%s status %s", ip, port, status)
+
+    def merge_gossip(self, sender_ip, sender_port, sender_clock, fields):
+        # O próprio remetente está ativo; as demais entradas seguem o formato do PEER_LIST
+        self.merge_neighbor(sender_ip, sender_port, "ONLINE", sender_clock, direct=True)
+        num_entries = int(fields[0]) if fields and fields[0].isdigit() else 0
+        for entry in fields[1:1 + num_entries]:
+            parts = entry.split(":")
+            if len(parts) < 4 or not parts[1].isdigit() or not parts[3].isdigit():
+                continue
+            ip, port, status, clock = parts[0], parts[1], parts[2], int(parts[3])
+            if (ip == self.ip and port == str(self.port)) or (ip == sender_ip and port == sender_port):
+                continue
+            self.merge_neighbor(ip, port, status, clock)
+
+    def gossip_digest(self):
+        """Resumo de tamanho limitado da tabela de vizinhos: o próprio peer e uma amostra aleatória dos demais"""
+        neighbors = self.neighbors.snapshot
+        sample = random.sample(neighbors, min(len(neighbors), GOSSIP_MAX_ENTRIES - 1))
+        entries = [f"{self.ip}:{self.port}:{self.status}:{self.clock.value}"]
+        entries += [f"{n.ip}:{n.port}:{n.status}:{n.clock}" for n in sample]
+        return f"{len(entries)} {' '.join(entries)}"
+
+    def gossip_round(self):
+        """Troca resumos da tabela de vizinhos com GOSSIP_FANOUT vizinhos sorteados"""
+        neighbors = self.neighbors.snapshot
+        for neighbor in random.sample(neighbors, min(len(neighbors), GOSSIP_FANOUT)):
+            message = protocol.format_message(self.ip, self.port, self.clock.tick(), "GOSSIP", self.gossip_digest())
+            self.send_command(message, neighbor.ip, neighbor.port, expect_response=True,
+                              timeout=GOSSIP_TIMEOUT, quiet=True)
+
+    # Inicia a troca periódica da tabela de vizinhos (anti-entropia): cada rodada sincroniza o peer com vizinhos
+    # sorteados, e a pertinência converge em toda a rede em O(log N) rodadas sem depender da opção 2
+    def start_gossip(self, interval=GOSSIP_INTERVAL):
+        def gossip_thread():
+            # Intervalo com variação aleatória, para os peers não fazerem as rodadas ao mesmo tempo
+            while not self.gossip_stop.wait(interval * random.uniform(0.5, 1.5)):
+                try:
+                    self.gossip_round()
+                except Exception as e:
+                    logger.error("[Erro] Falha na rodada de gossip: %s", e)
+
+        threading.Thread(target=gossip_thread, daemon=True).start()
+
+    def stop_gossip(self):
+        self.gossip_stop.set()
+
+    def ping(self, ip, port, timeout):
+        """Sonda o vizinho com PING e retorna o RTT, ou None se ele não respondeu a tempo"""
+        message = protocol.format_message(self.ip, self.port, self.clock.tick(), "PING")
+        started = time.monotonic()
+        try:
+            conn = self.pool.acquire(ip, port, timeout)
+        except OSError:
+            return None
+        try:
+            conn.sock.settimeout(timeout)
+            conn.sock.sendall(message.encode())
+            response, payload = self.read_message(conn.reader)
+        except OSError:
+            self.pool.discard(conn)
+            return None
+        rtt = time.monotonic() - started
+        if response is None:
+            # Versões antigas fecham a conexão sem responder a verbos desconhecidos: a conexão aceita já mostra
+            # que o peer está ativo (uma conexão reaproveitada, não, pois pode ter sido fechada antes)
+            self.pool.discard(conn)
+            return None if conn.reused else rtt
+        self.handle_command(response.decode(), conn.sock, payload)
+        self.pool.release(conn)
+        self.pool.record_rtt(conn.key, rtt)
+        return rtt
+
+    def neighbor_status(self, ip, port):
+        """Status do vizinho, ou None se o peer não está na lista de vizinhos"""
+        neighbor = self.neighbors.get(ip, port)
+        return neighbor.status if neighbor is not None else None
+
+    def live_peers(self, peers):
+        """Filtra os peers que o detector de falhas considera fora do ar (SUSPECT ou OFFLINE). Se nenhum sobrar,
+        tenta os suspeitos, que podem ter sido só lentos, e por fim todos."""
+        statuses = [(peer, self.neighbor_status(*peer)) for peer in peers]
+        online = [peer for peer, status in statuses if status not in ("SUSPECT", "OFFLINE")]
+        suspects = [peer for peer, status in statuses if status == "SUSPECT"]
+        return online or suspects or list(peers)
+
+    def query_neighbors(self, verb, neighbors, deadline=QUERY_DEADLINE):
+        """Envia verb a todos os vizinhos ao mesmo tempo e produz (vizinho, sucesso, duração) conforme as respostas
+        chegam. Para no prazo total deadline; quem não respondeu até lá fica de fora."""
+        results = queue.Queue()
+        started = time.monotonic()
+        end = started + deadline
+
+        def ask(neighbor, message):
+            # Cada envio tem como prazo o tempo que resta da consulta, inclusive para conectar
+            success = self.send_command(message, neighbor.ip, neighbor.port, expect_response=True,
+                                        timeout=max(0.01, end - time.monotonic()))
+            results.put((neighbor, success, time.monotonic() - started))
+
+        for neighbor in neighbors:
+            clock = self.increment_clock()
+            message = protocol.format_message(self.ip, self.port, clock, verb)
+            logger.info("Encaminhando mensagem '%s' para %s:%s", Truncated(message), neighbor.ip, neighbor.port)
+            threading.Thread(target=ask, args=(neighbor, message), daemon=True).start()
+
+        for _ in neighbors:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                yield results.get(timeout=remaining)
+            except queue.Empty:
                 return
 
-        neighbor_obj = {
-            "ip": ip,
-            "port": port,
-            "status": status,
-            "clock": clock
-        }
-        self.neighbors.append(neighbor_obj)
-        print(f"Adicionando novo peer {ip}:{port} status {status}")
+    def chunk_availability(self, file_name, file_size, chunk_size, peers, timeout=HAVE_TIMEOUT):
+        """Pergunta com HAVE, em paralelo, quais chunks (no tamanho de chunk deste download) os peers têm.
+        Retorna peer -> lista de chunks, ou None para quem já tem o arquivo inteiro; quem não responde fica sem chunks."""
+        def ask(peer):
+            message = protocol.format_message(self.ip, self.port, self.increment_clock(), "HAVE", file_name, file_size)
+            self.send_command(message, peer[0], peer[1], expect_response=True, timeout=timeout, quiet=True)
+
+        threads = [threading.Thread(target=ask, args=(peer,), daemon=True) for peer in peers]
+        for thread in threads:
+            thread.start()
+        end = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, end - time.monotonic()))
+
+        availability = {}
+        for peer in peers:
+            answer = self.chunk_maps.pop(((peer[0], int(peer[1])), file_name), None)
+            if answer is None or len(answer) < 2 or answer[1] == "NONE" or not answer[0].isdigit():
+                availability[peer] = []
+            elif answer[1] == "ALL":
+                availability[peer] = None
+            else:
+                try:
+                    bitmap = base64.b64decode(answer[1])
+                except ValueError:
+                    availability[peer] = []
+                    continue
+                availability[peer] = covered_chunks(bitmap, int(answer[0]) or chunk_size, file_size, chunk_size)
+        return availability
+
+    def start_download(self, filename, file_size, chunk_size):
+        """Cria o arquivo de destino do download, onde os chunks recebidos serão escritos.
+        Se houver um download interrompido do mesmo arquivo ele é retomado, com o tamanho de chunk original."""
+        sink = DownloadSink(self.shared_directory, filename, file_size, chunk_size)
+        self.active_downloads[filename] = sink
+        return sink
+
+    def finish_download(self, filename):
+        """Encerra o download, retornando o destino já fechado (e renomeado, se completo)"""
+        # O destino só sai de active_downloads depois de fechado e renomeado: durante o fsync ele continua servindo
+        # os chunks recebidos, e depois o arquivo final já existe
+        sink = self.active_downloads[filename]
+        try:
+            complete = sink.close()
+        finally:
+            del self.active_downloads[filename]
+        if complete:
+            self.shared_index.invalidate()
+            self.chunk_cache.invalidate(filename)
+            # O peer passa a ser mais uma fonte do arquivo
+            self.dht.announce(filename, sink.file_size)
+        return sink
 
     def store_chunk_data(self, filename, chunk_index, data):
-        """Armazena um chunk de dados recebido"""
-        if filename not in self.received_chunks:
-            self.received_chunks[filename] = {}
-        self.received_chunks[filename][chunk_index] = data
-    
+        """Escreve um chunk de dados recebido no arquivo do download em andamento"""
+        sink = self.active_downloads.get(filename)
+        if sink is None:
+            logger.warning("Chunk %s do arquivo %s recebido sem download em andamento", chunk_index, filename)
+            return
+        sink.write_chunk(chunk_index, data)
+
+    def missing_chunks(self, filename):
+        """Chunks que ainda faltam no download em andamento"""
+        return self.active_downloads[filename].missing_chunks()
+
+    def has_chunk(self, filename, chunk_index):
+        sink = self.active_downloads.get(filename)
+        return sink is not None and sink.has_chunk(chunk_index)
+
     def get_chunk_data(self, filename, chunk_index):
-        """Recupera um chunk de dados armazenado"""
-        return self.received_chunks.get(filename, {}).get(chunk_index)
+        """Recupera um chunk de dados já escrito no arquivo do download em andamento"""
+        sink = self.active_downloads.get(filename)
+        return sink.read_chunk(chunk_index) if sink is not None else None
@@ -0,0 +1,158 @@
+MAX_LINE = 16 * 1024 * 1024  # Maior linha de mensagem aceita (um FILE traz o chunk inteiro em base64)
+COMPACT_THRESHOLD = 65536    # Bytes já consumidos no início do buffer a partir dos quais ele é compactado
+
+
+# Mensagem que não segue o formato "<ip>:<porta> <clock> <VERBO> [argumentos...]"
+class ProtocolError(ValueError):
+    pass
+
+
+# Mensagem do protocolo já interpretada: remetente, clock, verbo e argumentos (as palavras depois do verbo).
+# O FILEB, que traz o chunk em bytes depois do cabeçalho, é interpretado à parte por parse_chunk_header.
+class Message:
+    __slots__ = ("sender_ip", "sender_port", "clock", "verb", "args")
+
+    def __init__(self, sender_ip, sender_port, clock, verb, args):
+        self.sender_ip = sender_ip
+        self.sender_port = sender_port
+        self.clock = clock
+        self.verb = verb
+        self.args = args
+
+    @property
+    def sender(self):
+        return (self.sender_ip, int(self.sender_port))
+
+    def __repr__(self):
+        return f"Message({self.sender_ip}:{self.sender_port} {self.clock} {self.verb} {len(self.args)} args)"
+
+
+def parse(command):
+    """Interpreta uma mensagem (sem ou com o '\\n' final) com uma única divisão da linha"""
+    parts = command.split()
+    try:
+        sender_ip, _, sender_port = parts[0].rpartition(":")
+        return Message(sender_ip, sender_port, int(parts[1]), parts[2], parts[3:])
+    except (IndexError, ValueError):
+        raise ProtocolError(f"mensagem inválida: {command[:80]!r}") from None
+
+
+# Modelo de cada mensagem por número de argumentos: a mensagem é montada de uma vez, numa só formatação
+MESSAGE_TEMPLATES = ["%s:%s %s %s" + " %s" * count + "\n" for count in range(16)]
+
+
+def format_message(ip, port, clock, verb, *args):
+    """Serializa uma mensagem, com o '\\n' que a delimita"""
+    if len(args) < len(MESSAGE_TEMPLATES):
+        return MESSAGE_TEMPLATES[len(args)] % (ip, port, clock, verb, *args)
+    return " ".join([f"{ip}:{port}", str(clock), verb, *map(str, args)]) + "\n"
+
+
+def parse_chunk_header(line):
+    """Interpreta a linha (bytes) de um FILEB sem criar uma Message, no caminho de cada chunk recebido no modo binário:
+    (ip, porta, clock, arquivo, tamanho de chunk, índice, tamanho do conteúdo, compressão ou None). None para as
+    demais mensagens."""
+    # maxsplit: o resto de uma linha FILE (o chunk em base64) fica num só campo, sem ser dividido
+    fields = line.split(maxsplit=8)
+    if len(fields) < 3 or fields[2] != b"FILEB":
+        return None
+    if len(fields) < 7 or not fields[6].isdigit():
+        raise ProtocolError("FILEB sem o tamanho do conteúdo")
+    # O conteúdo tem o mesmo limite de uma linha (um FILE traz o chunk em base64, maior ainda): sem ele, um cabeçalho
+    # qualquer faria o leitor esperar e guardar gigabytes
+    if int(fields[6]) > MAX_LINE:
+        raise ProtocolError(f"conteúdo do FILEB maior que o limite: {int(fields[6])} bytes")
+    try:
+        sender_ip, _, sender_port = fields[0].decode().rpartition(":")
+        return (sender_ip, sender_port, int(fields[1]), fields[3].decode(), int(fields[4]), int(fields[5]),
+                int(fields[6]), fields[7].decode() if len(fields) > 7 else None)
+    except (UnicodeDecodeError, ValueError):
+        raise ProtocolError(f"cabeçalho FILEB inválido: {line[:80]!r}") from None
+
+
+# Separa as mensagens de um fluxo de bytes recebido em pedaços de qualquer tamanho: linhas terminadas em '\n',
+# seguidas do conteúdo binário no caso do FILEB. Não faz I/O, então serve aos sockets e a qualquer outro transporte.
+class FrameDecoder:
+    def __init__(self, max_line=MAX_LINE):
+        self.buffer = bytearray()
+        self.start = 0          # Início dos bytes ainda não consumidos
+        self.scanned = 0        # Até onde o buffer já foi procurado por '\n'
+        self.header = None      # Linha de um FILEB esperando o conteúdo
+        self.chunk_header = None  # Essa linha já interpretada (parse_chunk_header)
+        self.needed = 0         # Tamanho desse conteúdo
+        self.max_line = max_line
+
+    def feed(self, data):
+        if self.start >= COMPACT_THRESHOLD:
+            del self.buffer[:self.start]
+            self.scanned -= self.start
+            self.start = 0
+        self.buffer += data
+
+    def buffered(self):
+        return len(self.buffer) - self.start
+
+    def missing(self):
+        """Bytes que faltam para completar o conteúdo pendente (0 se não há FILEB pela metade)"""
+        return max(0, self.needed - self.buffered()) if self.header is not None else 0
+
+    def next_frame(self):
+        """Próxima mensagem completa, ou None se ainda faltam bytes: (linha, None) ou, para um FILEB,
+        (linha, (cabeçalho interpretado, conteúdo))"""
+        buffer = self.buffer
+        start = self.start
+        if self.header is None:
+            # scanned nunca fica antes de start: a busca não repassa o que já foi procurado
+            index = buffer.find(b"\n", self.scanned)
+            if index < 0:
+                self.scanned = len(buffer)
+                if len(buffer) - start > self.max_line:
+                    raise ProtocolError("linha maior que o limite")
+                return None
+            line = bytes(buffer[start:index + 1])
+            start = index + 1
+            header = parse_chunk_header(line)
+            if header is None:
+                self._consume(start)
+                return line, None
+            self.header, self.chunk_header, self.needed = line, header, header[6]
+        end = start + self.needed
+        if len(buffer) < end:
+            self._consume(start)
+            return None
+        payload = bytes(buffer[start:end])
+        self._consume(end)
+        line, self.header = self.header, None
+        return line, (self.chunk_header, payload)
+
+    def finish(self):
+        """Fim do fluxo: retorna a última linha, se ela veio sem '\\n', e falha se uma mensagem ficou pela metade"""
+        if self.header is not None:
+            raise ConnectionError("conexão encerrada no meio de uma mensagem")
+        if not self.buffered():
+            return None
+        line = bytes(self.buffer[self.start:])
+        self._consume(len(self.buffer))
+        return line
+
+    def _consume(self, end):
+        if end == len(self.buffer):
+            self.buffer.clear()
+            end = 0
+        self.start = self.scanned = end
+
+
+# Registro dos tratadores de cada verbo. O nível de log define como o recebimento aparece no log (None: a
+# mensagem é periódica e não é registrada); um verbo novo só precisa ser registrado, sem mexer no despacho.
+class HandlerRegistry:
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, verb, handler, log_level=None):
+        self.handlers[verb] = (handler, log_level)
+
+    def get(self, verb):
+        return self.handlers.get(verb)
+
+    def __contains__(self, verb):
+        return verb in self.handlers
@@ -0,0 +1,400 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+INITIAL_WINDOW = 2   # Requisições simultâneas iniciais por peer
+MAX_WINDOW = 16      # Limite de requisições simultâneas por peer
+MAX_ATTEMPTS = 3     # Tentativas por chunk antes de desistir dele
+MAX_PEER_FAILURES = 5  # Falhas seguidas para um peer ser retirado do download
+EWMA_ALPHA = 0.3     # Peso da nova amostra nas médias móveis de latência e vazão
+# Limites (em chunks "parados na fila" do peer) usados para ajustar a janela, como no TCP Vegas
+WINDOW_GROW_BELOW = 1.0
+WINDOW_SHRINK_ABOVE = 3.0
+
+LATENCY_SAMPLES = 256     # Latências recentes guardadas para os percentis
+HEDGE_PERCENTILE = 0.95   # Um chunk mais lento que esse percentil pode ser pedido em duplicata a outro peer
+HEDGE_FACTOR = 2.0        # ... multiplicado por este fator
+HEDGE_MIN_SAMPLES = 16    # Amostras necessárias antes de fazer hedging
+HEDGE_CHECK_INTERVAL = 0.05  # Intervalo em que workers ociosos procuram chunks atrasados [s]
+DEADLINE_PERCENTILE = 0.99
+DEADLINE_FACTOR = 4.0     # Prazo de uma requisição: esse múltiplo do percentil 99 da latência
+MIN_DEADLINE = 0.5        # Prazo mínimo de uma requisição [s]
+
+
+# Estado de um peer durante o download: sua fila de chunks, os que estão em andamento e as medições
+class PeerState:
+    def __init__(self, peer, window):
+        self.peer = peer
+        self.queue = deque()
+        self.in_flight = {}       # chunk -> instante em que o peer começou a atendê-lo (None: lote ainda na fila)
+        self.window = window
+        self.latency = None       # Média móvel da duração de uma requisição [s]
+        self.min_latency = None   # Menor duração observada, estimativa da latência sem fila [s]
+        self.throughput = None    # Média móvel da vazão entregue pelo peer [bytes/s]
+        self.completed = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.disabled = False
+        self.condition = None
+
+
+# Escalonador de chunks com roubo de trabalho: cada peer começa com um bloco contíguo do arquivo na sua fila,
+# e um peer que a esvazia rouba chunks do fim da fila mais longa. A janela de requisições simultâneas de cada
+# peer é ajustada pela latência e vazão medidas, de modo que peers rápidos recebem mais trabalho que os lentos.
+#
+# Chunks que falham são repassados a outro peer que ainda não falhou com eles, e peers que falham seguidamente
+# são retirados do download. Quando não há mais o que pedir, workers ociosos pedem em duplicata (hedging) os chunks
+# que estão demorando mais que o percentil HEDGE_PERCENTILE da latência; a primeira resposta vale e a outra é
+# descartada. No máximo um chunk é pedido em duplicata por chamada, e os de lotes DL_RANGE que ainda esperam na
+# fila do peer (pedidos, mas sem relógio até start) não contam como atrasados.
+#
+# Com availability (peer -> chunks que ele tem, None para quem tem o arquivo inteiro), peers com o arquivo pela
+# metade participam do download: só recebem os chunks que têm, e os chunks são distribuídos do mais raro ao mais
+# comum (rarest-first), para que os downloads simultâneos do mesmo arquivo tenham chunks diferentes a trocar.
+#
+# É seguro para uso por várias threads e também pelas corrotinas do AsyncPeer.
+class ChunkScheduler:
+    def __init__(self, total_chunks, peers, chunk_size, max_window=MAX_WINDOW,
+                 initial_window=INITIAL_WINDOW, adaptive=True, response_timeout=None, chunks=None, availability=None):
+        self.chunk_size = chunk_size
+        self.max_window = max_window
+        # Sem ajuste adaptativo a janela fica fixa em initial_window (usado nos lotes de DL_RANGE)
+        self.adaptive = adaptive
+        self.response_timeout = response_timeout
+        self.peers = {peer: PeerState(peer, initial_window) for peer in peers}
+        self.availability = {}    # peer -> chunks que ele tem (só os peers com o arquivo incompleto)
+        self.holders = {}         # chunk -> quantos peers o têm (só com availability)
+        self.queued = {}          # chunk -> PeerState em cuja fila ele está
+        self.attempts = {}
+        self.excluded = {}        # chunk -> peers que já falharam com ele
+        self.completed_chunks = set()
+        self.hedged = set()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.failed_chunks = []
+        self.rerouted = 0
+        self.hedges = 0
+        self.lock = threading.Lock()
+        # Uma condição por peer, sobre o mesmo lock: um chunk concluído só acorda os workers do peer que liberou espaço
+        for state in self.peers.values():
+            state.condition = threading.Condition(self.lock)
+
+        # chunks restringe o download a parte do arquivo (ex.: os que faltam num download retomado)
+        chunks = list(range(total_chunks)) if chunks is None else list(chunks)
+        states = list(self.peers.values())
+        if availability is None:
+            for position, state in enumerate(states):
+                start = len(chunks) * position // len(states)
+                end = len(chunks) * (position + 1) // len(states)
+                self._push_all(state, chunks[start:end])
+        else:
+            self._distribute(chunks, states, total_chunks, availability)
+
+    def _distribute(self, chunks, states, total_chunks, availability):
+        full = sum(1 for state in states if availability.get(state.peer) is None)
+        for state in states:
+            if availability.get(state.peer) is not None:
+                self.availability[state.peer] = set(availability[state.peer])
+        self.holders = {chunk_index: full for chunk_index in chunks}
+        for available in self.availability.values():
+            for chunk_index in available:
+                if chunk_index in self.holders:
+                    self.holders[chunk_index] += 1
+        # Do mais raro ao mais comum. Entre chunks igualmente raros vale a ordem do arquivo a partir de uma posição
+        # sorteada: cada download começa num ponto diferente, mas os chunks de um peer continuam em sequência.
+        rotation = random.randrange(max(1, total_chunks))
+        ordered = sorted(chunks, key=lambda c: (self.holders[c], (c - rotation) % max(1, total_chunks)))
+        # Blocos de até block chunks por peer; quando todos têm tudo, é a divisão em blocos contíguos
+        block = max(1, -(-len(chunks) // max(1, len(states))))
+        for chunk_index in ordered:
+            candidates = [state for state in states if self._has(state, chunk_index)]
+            if candidates:
+                self._push(min(candidates, key=lambda s: len(s.queue) // block), chunk_index)
+            else:
+                # Nenhum peer tem o chunk: o download termina sem ele e pode ser retomado depois
+                self.failed_chunks.append(chunk_index)
+
+    def next_chunk(self, peer):
+        """Próximo chunk para o peer, esperando enquanto sua janela estiver cheia; None quando não há mais o que pedir"""
+        batch = self.next_batch(peer, 1)
+        return batch[0] if batch else None
+
+    def next_batch(self, peer, max_chunks, block=True, start=True):
+        """Até max_chunks chunks para o peer; com block, espera até haver pelo menos um ou o download acabar.
+        Sem start, o relógio dos chunks só começa em start(), quando o peer passa a atender o lote."""
+        with self.lock:
+            state = self.peers[peer]
+            batch = []
+            hedges = self.hedges
+            while True:
+                while len(batch) < max_chunks:
+                    chunk_index = self._take(state, start, hedge=self.hedges == hedges)
+                    if chunk_index is None:
+                        break
+                    batch.append(chunk_index)
+                if batch or not block or state.disabled or self._finished():
+                    return batch
+                # Acorda periodicamente para procurar chunks atrasados para o hedging
+                state.condition.wait(HEDGE_CHECK_INTERVAL if self._hedging_possible() else None)
+
+    def start(self, peer, chunks):
+        """Começa o relógio dos chunks de um lote pedido com start=False"""
+        with self.lock:
+            state = self.peers[peer]
+            now = time.monotonic()
+            for chunk_index in chunks:
+                if chunk_index in state.in_flight and state.in_flight[chunk_index] is None:
+                    state.in_flight[chunk_index] = now
+
+    def try_next_chunk(self, peer):
+        """Versão sem espera de next_chunk: None se a janela está cheia ou não há chunk disponível agora"""
+        with self.lock:
+            return self._take(self.peers[peer])
+
+    def complete(self, peer, chunk_index, size, elapsed, sample=True):
+        """Registra o chunk recebido; sample=False não conta elapsed nos percentis (ex.: chunks de um lote DL_RANGE,
+        que entra uma vez só)"""
+        with self.lock:
+            state = self.peers[peer]
+            state.in_flight.pop(chunk_index, None)
+            state.consecutive_failures = 0
+            if chunk_index not in self.completed_chunks:
+                self.completed_chunks.add(chunk_index)
+                state.completed += 1
+                if sample:
+                    self.latencies.append(elapsed)
+                self._update_measurements(state, size, elapsed)
+                # Descarta a cópia duplicada que ainda está em andamento em outro peer
+                if chunk_index in self.hedged:
+                    for other in self.peers.values():
+                        other.in_flight.pop(chunk_index, None)
+            if self._finished():
+                self._notify_all()
+            else:
+                state.condition.notify(state.window - len(state.in_flight))
+
+    def fail(self, peer, chunk_index):
+        """Repassa o chunk a outro peer (até MAX_ATTEMPTS vezes) e reduz a janela do peer"""
+        self.fail_batch(peer, [chunk_index])
+
+    def fail_batch(self, peer, chunks):
+        """Repassa os chunks de um lote que falhou; o lote conta como uma única falha do peer"""
+        with self.lock:
+            state = self.peers[peer]
+            for chunk_index in chunks:
+                state.in_flight.pop(chunk_index, None)
+            state.failed += 1
+            state.consecutive_failures += 1
+            if self.adaptive:
+                state.window = max(1, state.window // 2)
+            if state.consecutive_failures >= MAX_PEER_FAILURES and not state.disabled:
+                self._disable(state)
+            for chunk_index in chunks:
+                self._reroute(state, chunk_index)
+            self._notify_all()
+
+    def requeue(self, peer, chunk_index):
+        """Devolve um chunk pedido ao início da fila do peer, sem contar como falha"""
+        with self.lock:
+            state = self.peers[peer]
+            # O instante pode ser None (lote pedido que ainda não começou): a presença é que conta
+            if chunk_index in state.in_flight and chunk_index not in self.completed_chunks:
+                self._push(state, chunk_index, front=True)
+            state.in_flight.pop(chunk_index, None)
+            self._notify_all()
+
+    def peer_error(self, peer):
+        """Registra um erro do peer que não afetou nenhum chunk (ex.: conexão recusada)"""
+        with self.lock:
+            state = self.peers[peer]
+            state.failed += 1
+            state.consecutive_failures += 1
+            if state.consecutive_failures >= MAX_PEER_FAILURES and not state.disabled:
+                self._disable(state)
+                self._notify_all()
+
+    def add_available(self, peer, chunks):
+        """Registra chunks que um peer com o arquivo incompleto passou a ter (None: passou a ter o arquivo inteiro)"""
+        with self.lock:
+            available = self.availability.get(peer)
+            if available is None:
+                return
+            for chunk_index in self.holders if chunks is None else chunks:
+                if chunk_index not in available:
+                    available.add(chunk_index)
+                    if chunk_index in self.holders:
+                        self.holders[chunk_index] += 1
+            self._notify_all()
+
+    def is_active(self, peer):
+        """Se o peer ainda participa de um download que não terminou"""
+        with self.lock:
+            return not self.peers[peer].disabled and not self._finished()
+
+    def request_timeout(self):
+        """Prazo de uma requisição, derivado do percentil 99 das latências observadas"""
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return self.response_timeout
+            deadline = max(MIN_DEADLINE, DEADLINE_FACTOR * self._percentile(DEADLINE_PERCENTILE))
+            return min(deadline, self.response_timeout) if self.response_timeout else deadline
+
+    def finished(self):
+        with self.lock:
+            return self._finished()
+
+    def _reroute(self, state, chunk_index):
+        # Se a cópia duplicada ainda está em andamento (ou já chegou), não há o que repassar
+        if chunk_index in self.completed_chunks or any(chunk_index in s.in_flight for s in self.peers.values()):
+            return
+        self.excluded.setdefault(chunk_index, set()).add(state.peer)
+        self.attempts[chunk_index] = self.attempts.get(chunk_index, 0) + 1
+        candidates = [s for s in self.peers.values()
+                      if not s.disabled and s.peer not in self.excluded[chunk_index] and self._has(s, chunk_index)]
+        if self.attempts[chunk_index] >= MAX_ATTEMPTS or not candidates:
+            self.failed_chunks.append(chunk_index)
+        else:
+            # No início da fila do peer menos carregado, para ser pedido logo
+            target = min(candidates, key=lambda s: len(s.queue) + len(s.in_flight))
+            self._push(target, chunk_index, front=True)
+            self.rerouted += 1
+
+    def _take(self, state, start=True, hedge=True):
+        if state.disabled or len(state.in_flight) >= state.window:
+            return None
+        if state.queue:
+            chunk_index = state.queue.popleft()
+            self.queued.pop(chunk_index, None)
+        else:
+            chunk_index = self._steal(state)
+            if chunk_index is None and hedge:
+                chunk_index = self._hedge(state)
+        if chunk_index is not None:
+            state.in_flight[chunk_index] = time.monotonic() if start else None
+        return chunk_index
+
+    def _steal(self, state):
+        if state.peer in self.availability:
+            return self._steal_available(state)
+        # Rouba do fim das filas mais longas, pulando chunks com que o peer já falhou
+        for victim in sorted(self.peers.values(), key=lambda s: len(s.queue), reverse=True):
+            if not victim.queue:
+                return None
+            chunk_index = victim.queue[-1]
+            if state.peer not in self.excluded.get(chunk_index, ()):
+                self.queued.pop(chunk_index, None)
+                return victim.queue.pop()
+        return None
+
+    def _steal_available(self, state):
+        # Um peer com o arquivo incompleto só pode roubar os chunks que tem: leva para a sua fila metade dos que
+        # estão esperando na fila de outro peer, dos mais raros aos mais comuns, e começa pelo primeiro
+        stealable = [chunk_index for chunk_index in self.availability[state.peer]
+                     if chunk_index in self.queued and state.peer not in self.excluded.get(chunk_index, ())]
+        if not stealable:
+            return None
+        stealable.sort(key=lambda c: (self.holders.get(c, 0), c))
+        for chunk_index in stealable[:max(1, len(stealable) // 2)]:
+            self.queued.pop(chunk_index).queue.remove(chunk_index)
+            self._push(state, chunk_index)
+        chunk_index = state.queue.popleft()
+        self.queued.pop(chunk_index, None)
+        return chunk_index
+
+    def _hedge(self, state):
+        # Pede em duplicata o chunk em andamento mais antigo entre os que passaram do limite de latência
+        threshold = self._hedge_threshold()
+        if threshold is None:
+            return None
+        now = time.monotonic()
+        oldest = None
+        for other in self.peers.values():
+            if other is state:
+                continue
+            for chunk_index, started in other.in_flight.items():
+                if (started is None or chunk_index in self.hedged or chunk_index in state.in_flight
+                        or state.peer in self.excluded.get(chunk_index, ()) or not self._has(state, chunk_index)):
+                    continue
+                if now - started > threshold and (oldest is None or started < oldest[1]):
+                    oldest = (chunk_index, started)
+        if oldest is None:
+            return None
+        self.hedged.add(oldest[0])
+        self.hedges += 1
+        return oldest[0]
+
+    def _hedge_threshold(self):
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return HEDGE_FACTOR * self._percentile(HEDGE_PERCENTILE)
+
+    def _hedging_possible(self):
+        return self._hedge_threshold() is not None and any(s.in_flight for s in self.peers.values())
+
+    def _percentile(self, fraction):
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def _disable(self, state):
+        # Redistribui a fila do peer entre os demais
+        state.disabled = True
+        others = [s for s in self.peers.values() if not s.disabled]
+        while state.queue:
+            chunk_index = state.queue.popleft()
+            self.queued.pop(chunk_index, None)
+            candidates = [s for s in others
+                          if s.peer not in self.excluded.get(chunk_index, ()) and self._has(s, chunk_index)]
+            if candidates:
+                self._push(min(candidates, key=lambda s: len(s.queue)), chunk_index)
+            else:
+                self.failed_chunks.append(chunk_index)
+
+    def _has(self, state, chunk_index):
+        available = self.availability.get(state.peer)
+        return available is None or chunk_index in available
+
+    def _push(self, state, chunk_index, front=False):
+        if front:
+            state.queue.appendleft(chunk_index)
+        else:
+            state.queue.append(chunk_index)
+        self.queued[chunk_index] = state
+
+    def _push_all(self, state, chunks):
+        state.queue.extend(chunks)
+        for chunk_index in chunks:
+            self.queued[chunk_index] = state
+
+    def _finished(self):
+        return all(not s.queue and not s.in_flight for s in self.peers.values())
+
+    def _notify_all(self):
+        for state in self.peers.values():
+            state.condition.notify_all()
+
+    def _update_measurements(self, state, size, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        if state.latency is None:
+            state.latency = elapsed
+            state.min_latency = elapsed
+        else:
+            state.latency += EWMA_ALPHA * (elapsed - state.latency)
+            state.min_latency = min(state.min_latency, elapsed)
+
+        # Com n requisições em andamento, o peer entrega n chunks a cada latency segundos
+        throughput = (len(state.in_flight) + 1) * size / state.latency
+        if state.throughput is None:
+            state.throughput = throughput
+        else:
+            state.throughput += EWMA_ALPHA * (throughput - state.throughput)
+
+        if not self.adaptive:
+            return
+        # Diferença entre a vazão esperada sem fila e a medida, convertida em chunks parados no peer
+        expected = state.window * self.chunk_size / state.min_latency
+        queued = (expected - state.throughput) * state.min_latency / self.chunk_size
+        if queued < WINDOW_GROW_BELOW:
+            state.window = min(self.max_window, state.window + 1)
+        elif queued > WINDOW_SHRINK_ABOVE:
+            state.window = max(1, state.window - 1)
@@ -0,0 +1,79 @@
+import logging
+import os
+import threading
+import time
+from download_sink import PART_SUFFIX, MANIFEST_SUFFIX
+
+
+INDEX_REVALIDATE_INTERVAL = 5.0  # Intervalo entre verificações completas dos tamanhos dos arquivos [s]
+RACY_WINDOW = 2.0                # Um diretório modificado há menos que isso pode mudar de novo sem alterar o mtime [s]
+
+logger = logging.getLogger(__name__)
+
+
+# Índice do diretório compartilhado com a resposta do LS já serializada. Criar, apagar ou renomear um arquivo
+# altera o mtime do diretório, então enquanto ele não muda basta um stat por LS; quando muda, só os arquivos novos
+# são consultados. Mudanças de tamanho de um arquivo existente não alteram o mtime do diretório e são detectadas
+# por uma verificação completa a cada INDEX_REVALIDATE_INTERVAL segundos.
+class SharedIndex:
+    def __init__(self, directory, ip, port):
+        self.directory = directory
+        self.ip = ip
+        self.port = port
+        self.entries = {}         # nome -> tamanho
+        self.dir_mtime = None
+        self.last_revalidate = 0.0
+        self.dirty = True
+        self.response_body = ""   # "<quantidade> nome:tamanho:ip:porta ..."
+        self.summary = ""         # "nome:tamanho ...", usado nos logs
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        """Força uma nova leitura do diretório no próximo LS"""
+        self.dirty = True
+
+    def listing(self):
+        """Retorna (corpo da resposta LS_LIST, resumo sem ip) atualizados"""
+        with self.lock:
+            try:
+                dir_mtime = os.stat(self.directory).st_mtime_ns
+            except OSError as e:
+                logger.error("Erro ao ler o diretório %s: %s", self.directory, e)
+                return "0 ", ""
+            now = time.monotonic()
+            if self.dirty or dir_mtime != self.dir_mtime:
+                self._scan(dir_mtime, now, full=False)
+            elif now - self.last_revalidate >= INDEX_REVALIDATE_INTERVAL:
+                self._scan(dir_mtime, now, full=True)
+            return self.response_body, self.summary
+
+    def _scan(self, dir_mtime, now, full):
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            logger.error("Erro ao ler o diretório %s: %s", self.directory, e)
+            return
+        # Downloads em andamento (.part) e seus manifestos não são anunciados
+        names = [name for name in names if not name.endswith((PART_SUFFIX, MANIFEST_SUFFIX))]
+
+        entries = {}
+        for name in names:
+            size = None if full else self.entries.get(name)
+            if size is None:
+                try:
+                    size = os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    # Apagado entre o listdir e o stat
+                    continue
+            entries[name] = size
+
+        self.entries = entries
+        self.dir_mtime = dir_mtime
+        # Sem índice anterior todos os tamanhos foram lidos agora
+        if full or not self.last_revalidate:
+            self.last_revalidate = now
+        # Com o mtime muito recente, uma mudança no mesmo tique do relógio do sistema de arquivos passaria despercebida
+        self.dirty = time.time() - dir_mtime / 1e9 < RACY_WINDOW
+        files = [f"{name}:{size}:{self.ip}:{self.port}" for name, size in entries.items()]
+        self.response_body = f"{len(entries)} {' '.join(files)}"
+        self.summary = " ".join(f"{name}:{size}" for name, size in entries.items())
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from failure_detector import FailureDetector
+from helpers import free_ports
+from peer import Peer
+
+
+NEIGHBORS = 12      # Vizinhos mandando heartbeats ao peer observado
+WORKERS = 4         # Workers do servidor do peer observado, menos que os vizinhos
+INTERVAL = 0.25     # Intervalo entre heartbeats nos testes [s]
+DURATION = 3.0      # Tempo observado [s]
+
+
+class FailureDetectorTest(unittest.TestCase):
+    def test_more_neighbors_than_workers(self):
+        """Heartbeats keep-alive de mais vizinhos que workers não podem deixar o peer observado SUSPECT"""
+        target_port, *ports = free_ports(NEIGHBORS + 1)
+        directory = tempfile.mkdtemp()
+        neighbors_file = os.path.join(directory, "vizinhos")
+        with open(neighbors_file, "w") as file:
+            file.write(f"127.0.0.1:{target_port}\n")
+        target = Peer.create_peer("127.0.0.1", str(target_port), directory, "ONLINE", os.devnull, 4096,
+                                  server_workers=WORKERS)
+        neighbors = [Peer.create_peer("127.0.0.1", str(port), directory, "ONLINE", neighbors_file, 4096)
+                     for port in ports]
+        time.sleep(0.3)
+        for peer in neighbors:
+            peer.change_neighbor_status("127.0.0.1", target_port, "ONLINE", 0)
+            peer.detector = FailureDetector(peer, interval=INTERVAL)
+            peer.detector.start()
+        try:
+            end = time.monotonic() + DURATION
+            while time.monotonic() < end:
+                statuses = [peer.neighbor_status("127.0.0.1", target_port) for peer in neighbors]
+                self.assertEqual(statuses, ["ONLINE"] * NEIGHBORS)
+                time.sleep(INTERVAL)
+        finally:
+            for peer in neighbors:
+                peer.detector.stop()
+        self.assertGreater(target.server_stats["accepted"], 0)
+
+    def test_tick_keeps_concurrent_status_change(self):
+        """Um status trocado depois da classificação (ex.: por um HELLO) não é sobrescrito pelo detector"""
+        port, neighbor_port = free_ports(2)
+        directory = tempfile.mkdtemp()
+        neighbors_file = os.path.join(directory, "vizinhos")
+        with open(neighbors_file, "w") as file:
+            file.write(f"127.0.0.1:{neighbor_port}\n")
+        peer = Peer.create_peer("127.0.0.1", str(port), directory, "ONLINE", neighbors_file, 4096)
+        self.assertTrue(peer.neighbors.set_status("127.0.0.1", neighbor_port, "ONLINE", "OFFLINE"))
+        self.assertFalse(peer.neighbors.set_status("127.0.0.1", neighbor_port, "SUSPECT", "OFFLINE"))
+        self.assertEqual(peer.neighbor_status("127.0.0.1", neighbor_port), "ONLINE")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scheduler import ChunkScheduler, HEDGE_MIN_SAMPLES, MAX_PEER_FAILURES
+
+
+TOTAL_CHUNKS = 64   # Metade na fila de cada peer
+BATCH = 16          # Chunks de cada lote DL_RANGE (a fila de um peer cabe em dois)
+LATENCY = 0.001     # Latência das amostras iniciais: o limite do hedging fica em poucos milissegundos [s]
+WAIT = 0.05         # Espera para um chunk em andamento passar do limite do hedging [s]
+
+
+class ChunkSchedulerTest(unittest.TestCase):
+    def range_scheduler(self):
+        """Escalonador como o do download com DL_RANGE, com amostras de latência suficientes para o hedging e a fila
+        do peer "b" vazia, de modo que ele só pode pedir chunks do peer "a" em duplicata"""
+        window = 2 * BATCH
+        scheduler = ChunkScheduler(TOTAL_CHUNKS, ["a", "b"], 1024, max_window=window, initial_window=window,
+                                   adaptive=False)
+        chunks = scheduler.next_batch("b", TOTAL_CHUNKS // 2)
+        self.assertGreaterEqual(len(chunks), HEDGE_MIN_SAMPLES)
+        for chunk_index in chunks:
+            scheduler.complete("b", chunk_index, 1024, LATENCY)
+        return scheduler
+
+    def test_hedges_one_chunk_per_call(self):
+        scheduler = self.range_scheduler()
+        first = scheduler.next_batch("a", 2 * BATCH)
+        time.sleep(WAIT)
+        hedged = scheduler.next_batch("b", BATCH, block=False)
+        self.assertEqual(len(hedged), 1)
+        self.assertIn(hedged[0], first)
+
+    def test_queued_batch_is_not_hedged(self):
+        scheduler = self.range_scheduler()
+        first = scheduler.next_batch("a", BATCH)
+        second = scheduler.next_batch("a", BATCH, start=False)
+        for chunk_index in first:
+            scheduler.complete("a", chunk_index, 1024, LATENCY, sample=False)
+        time.sleep(WAIT)
+        # O segundo lote ainda espera o peer começar a atendê-lo
+        self.assertEqual(scheduler.next_batch("b", BATCH, block=False), [])
+
+        scheduler.start("a", second)
+        time.sleep(WAIT)
+        hedged = scheduler.next_batch("b", BATCH, block=False)
+        self.assertEqual(len(hedged), 1)
+        self.assertIn(hedged[0], second)
+        self.assertEqual(scheduler.hedges, 1)
+
+    def test_failed_batch_counts_once(self):
+        """Um lote sem nenhum chunk (ex.: RANGE_END 0) é uma falha do peer, não uma por chunk"""
+        scheduler = ChunkScheduler(TOTAL_CHUNKS, ["a", "b"], 1024, max_window=2 * BATCH, initial_window=2 * BATCH,
+                                   adaptive=False)
+        batch = scheduler.next_batch("a", BATCH)
+        self.assertGreater(len(batch), MAX_PEER_FAILURES)
+        scheduler.fail_batch("a", batch)
+        self.assertEqual(scheduler.peers["a"].consecutive_failures, 1)
+        self.assertTrue(scheduler.is_active("a"))
+        self.assertEqual(scheduler.rerouted, len(batch))
+
+    def test_requeue_queued_batch(self):
+        """Chunks de um lote que ainda não começou voltam à fila (ex.: peer que não entende DL_RANGE)"""
+        scheduler = ChunkScheduler(TOTAL_CHUNKS, ["a"], 1024, max_window=TOTAL_CHUNKS, initial_window=TOTAL_CHUNKS,
+                                   adaptive=False)
+        first = scheduler.next_batch("a", BATCH)
+        second = scheduler.next_batch("a", BATCH, start=False)
+        for chunk_index in first + second:
+            scheduler.requeue("a", chunk_index)
+        self.assertEqual(sorted(scheduler.next_batch("a", TOTAL_CHUNKS)), list(range(TOTAL_CHUNKS)))
+
+
+if __name__ == "__main__":
+    unittest.main()
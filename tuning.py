@@ -0,0 +1,43 @@
+import math
+
+
+AUTO_CHUNK_SIZE = 0            # Valor de Peer.chunck_size que ativa a escolha automática
+MIN_CHUNK_SIZE = 256
+MAX_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MIN_CHUNK_SIZE = 16 * 1024  # Piso usado enquanto não há medições de RTT e vazão
+MIN_CHUNKS_PER_PEER = 16       # Chunks por peer para o roubo de trabalho conseguir equilibrar a carga
+OVERHEAD_FACTOR = 4            # Um chunk deve levar pelo menos esse múltiplo do RTT para ser transmitido
+MIN_BATCH = 4                  # Limites do número de chunks por DL_RANGE
+TARGET_REQUEST_TIME = 0.05     # Tempo de transmissão desejado para cada DL_RANGE [s]
+
+
+# Escolhe o tamanho de chunk de um download. Chunks pequenos demais gastam o tempo com o custo fixo de cada
+# pedido (nossos experimentos em csv/ mostram o tempo caindo à medida que o chunk cresce); chunks grandes demais
+# deixam poucos chunks por peer e um peer lento segura o fim do download.
+#   rtt: RTT medido até os peers [s]; throughput: vazão recente por peer [bytes/s]
+def choose_chunk_size(file_size, num_peers, rtt=None, throughput=None):
+    if file_size <= 0:
+        return MIN_CHUNK_SIZE
+
+    # Piso: transmitir um chunk precisa custar bem mais que o RTT do pedido
+    lower = DEFAULT_MIN_CHUNK_SIZE
+    if rtt and throughput:
+        lower = max(MIN_CHUNK_SIZE, OVERHEAD_FACTOR * throughput * rtt)
+
+    # Teto: cada peer precisa de chunks suficientes para o balanceamento
+    upper = file_size / (max(1, num_peers) * MIN_CHUNKS_PER_PEER)
+
+    # Em arquivos pequenos o custo dos pedidos domina, então o piso prevalece sobre o teto
+    size = max(lower, min(upper, MAX_CHUNK_SIZE))
+    size = min(size, MAX_CHUNK_SIZE, file_size)
+    # Arredonda para uma potência de 2
+    return max(MIN_CHUNK_SIZE, 1 << math.ceil(math.log2(max(1, size))))
+
+
+# Número de chunks do próximo DL_RANGE a partir da vazão medida no peer: pedidos maiores à medida que a vazão
+# cresce, para que cada pedido leve cerca de TARGET_REQUEST_TIME (equivale a aumentar o chunk durante o download)
+def next_batch_size(throughput, chunk_size, max_batch):
+    if not throughput:
+        return None
+    batch = math.ceil(throughput * TARGET_REQUEST_TIME / chunk_size)
+    return max(MIN_BATCH, min(max_batch, batch))